@@ -1,21 +1,37 @@
-# Handles user profile information such as age, weight, height, goals, etc.
-from .profile_agent import ProfileAgent
+import importlib
 
-# Responsible for generating or managing personalized workout plans
-from .workout_agent import WorkoutAgent
+# Agent classes and their modules, imported on first access so that using one
+# agent does not load the LLM stack of the others
+_EXPORTS = {
+    # Handles user profile information such as age, weight, height, goals, etc.
+    "ProfileAgent": ".profile_agent",
 
-# Manages dietary recommendations and nutrition tracking
-from .nutrition_agent import NutritionAgent
+    # Responsible for generating or managing personalized workout plans
+    "WorkoutAgent": ".workout_agent",
 
-# Tracks user progress over time (e.g., weight loss, strength gains)
-from .progress_agent import ProgressAgent
+    # Manages dietary recommendations and nutrition tracking
+    "NutritionAgent": ".nutrition_agent",
 
-# Collects and processes user feedback to adapt plans or improve service
-from .feedback_agent import FeedbackAgent
+    # Tracks user progress over time (e.g., weight loss, strength gains)
+    "ProgressAgent": ".progress_agent",
 
-# Coordinates actions between different agents to ensure consistency and synergy
-from .coordinator_agent import CoordinatorAgent
+    # Collects and processes user feedback to adapt plans or improve service
+    "FeedbackAgent": ".feedback_agent",
 
-# Dynamically generates rules or logic based on user behavior or feedback
-from .dynamic_rule_generator import DynamicRuleGenerator
+    # Coordinates actions between different agents to ensure consistency and synergy
+    "CoordinatorAgent": ".coordinator_agent",
 
+    # Dynamically generates rules or logic based on user behavior or feedback
+    "DynamicRuleGenerator": ".dynamic_rule_generator",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
@@ -1,25 +1,123 @@
-import json
+import atexit
 import os
-from datetime import datetime
+import threading
+import time
+from agents.json_utils import dumps_line
+
+# Set once the data directory has been created in this process
+_INIT_DONE = False
+
+LOG_FILE = os.path.join('data', 'agent_logs.jsonl')
+# Buffered log entries are written once this many have collected...
+LOG_FLUSH_EVERY = 32
+# ...or at most this many seconds after the first of them was logged
+LOG_FLUSH_SECONDS = 1.0
+
+# Log file handle and buffer shared by all agents; the file is opened on first write
+_log_fh = None
+_log_buffer = []
+_log_lock = threading.Lock()
+# Pending timer that writes the buffer once LOG_FLUSH_SECONDS have passed
+_log_timer = None
+
+# Local-time prefix of the last formatted second: (epoch second, 'YYYY-MM-DDTHH:MM:SS')
+_ts_cache = (None, '')
+
+
+def _now_iso() -> str:
+    """
+    Return the current local time in datetime.now().isoformat() format.
+
+    The date and time are formatted at most once per second; within the
+    same second only the microseconds are added to the cached prefix.
+    """
+    global _ts_cache
+    now = time.time()
+    second = int(now)
+    cached_second, prefix = _ts_cache
+    if second != cached_second:
+        prefix = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(second))
+        _ts_cache = (second, prefix)
+    return f"{prefix}.{int((now - second) * 1_000_000):06d}"
+
+
+def create_file_if_missing(path: str, content: bytes = b'') -> bool:
+    """
+    Create a file with initial content unless it already exists.
+
+    Exclusive creation replaces the exists-then-open pattern with a single,
+    race-free open call.
+
+    Args:
+        path: Path of the file to create
+        content: Initial file content
+
+    Returns:
+        True if the file was created, False if it already existed
+    """
+    try:
+        with open(path, 'xb') as f:
+            f.write(content)
+    except FileExistsError:
+        return False
+    return True
+
+def _flush_log_buffer() -> None:
+    """Write the buffered log entries to the log file. Caller holds _log_lock."""
+    global _log_fh, _log_buffer, _log_timer
+    lines, _log_buffer = _log_buffer, []
+    if _log_timer is not None:
+        _log_timer.cancel()
+        _log_timer = None
+    if not lines:
+        return
+    try:
+        if _log_fh is None:
+            _log_fh = open(LOG_FILE, 'ab', buffering=1 << 16)
+        _log_fh.write(b''.join(lines))
+        _log_fh.flush()
+    except Exception as e:
+        print(f"Failed to log action: {e}")  # Print error if logging fails
+
+
+def flush_logs() -> None:
+    """Write all buffered log entries to the log file."""
+    with _log_lock:
+        _flush_log_buffer()
+
+
+def _schedule_log_flush() -> None:
+    """Start the flush timer unless one is already pending. Caller holds _log_lock."""
+    global _log_timer
+    if _log_timer is None:
+        _log_timer = threading.Timer(LOG_FLUSH_SECONDS, flush_logs)
+        _log_timer.daemon = True
+        _log_timer.start()
+
+
+# Make sure buffered entries are written when the process exits
+atexit.register(flush_logs)
 
 class BaseAgent:
     """
     Base class for all agent classes providing common functionality
     such as logging capabilities.
     """
-    def __init__(self):
-        """Initialize the BaseAgent with log file setup."""
-        self.log_file = 'data/agent_logs.json'
-        # Create the data directory if it doesn't exist
-        os.makedirs('data', exist_ok=True)
-        # Initialize the log file
-        self._initialize_log_file()
-
-    def _initialize_log_file(self):
-        """Initialize the log file if it doesn't exist."""
-        if not os.path.exists(self.log_file):
-            with open(self.log_file, 'w') as f:
-                json.dump([], f)  # Initialize with an empty list
+    def __init__(self, flush_every: int = LOG_FLUSH_EVERY):
+        """
+        Initialize the BaseAgent with log file setup.
+
+        Args:
+            flush_every: Number of buffered log entries to collect before
+                         they are written to the log file
+        """
+        self.log_file = LOG_FILE
+        self.flush_every = flush_every
+        # Create the data directory once per process
+        global _INIT_DONE
+        if not _INIT_DONE:
+            os.makedirs('data', exist_ok=True)
+            _INIT_DONE = True
 
     def log_decision(self, user_id: str, action: str, reason: str = None, metadata: dict = None) -> None:
         """
@@ -40,7 +138,7 @@ class BaseAgent:
         """
         # Create the log entry with basic information
         log_entry = {
-            'timestamp': datetime.now().isoformat(),  # Current timestamp in ISO format
+            'timestamp': _now_iso(),                  # Current timestamp in ISO format
             'agent': self.__class__.__name__,         # Name of the agent class
             'action': action,                        # Description of the action
             'user_id': user_id                       # User associated with the action
@@ -52,26 +150,32 @@ class BaseAgent:
         if metadata:
             log_entry['metadata'] = metadata  # Add additional context data
 
-        # Read existing logs from file
+        # Serialize the entry as a single JSON line
         try:
-            with open(self.log_file, 'r') as f:
-                logs = json.load(f)
-                # Ensure logs is a list (in case file is corrupted)
-                if not isinstance(logs, list):
-                    logs = []
-        except (FileNotFoundError, json.JSONDecodeError):
-            # If file doesn't exist or contains invalid JSON, start with empty list
-            logs = []
-
-        # Append the new log entry
-        logs.append(log_entry)
-
-        # Write the updated logs back to file
-        try:
-            with open(self.log_file, 'w') as f:
-                json.dump(logs, f, indent=2)  # Write with pretty-print formatting
+            line = dumps_line(log_entry)
         except Exception as e:
             print(f"Failed to log action: {e}")  # Print error if logging fails
+            return
+
+        # Buffer it, writing the buffer once it is large or on the flush timer
+        with _log_lock:
+            _log_buffer.append(line)
+            if len(_log_buffer) >= self.flush_every:
+                _flush_log_buffer()
+            else:
+                _schedule_log_flush()
+
+    def flush_logs(self) -> None:
+        """
+        Write all buffered log entries to the log file.
+
+        Entries are appended as JSON Lines, so earlier entries are never
+        re-read or re-written. The buffer is shared by all agents.
+
+        Returns:
+            None
+        """
+        flush_logs()
 
     def _log_action(self, user_id: str, message: str) -> None:
         """
@@ -1,36 +1,52 @@
-import json
 import os
-from typing import Dict, Any, Optional
-from agents.base_agent import BaseAgent
+import re
+from typing import Dict, Any, Optional, Set
+from agents.base_agent import BaseAgent, create_file_if_missing
 from agents.dynamic_rule_generator import DynamicRuleGenerator
+from agents.feedback_agent import DB_FILE, get_feedback_db, load_feedback_data
+from agents.json_utils import dumps, loads
+
+# Terms the conflict checks look for in feedback and health information
+_CONFLICT_TERMS = ("high intensity", "outdoor", "rain", "extreme_heat", "injury", "heart_condition", "asthma")
+_CONFLICT_RE = re.compile("(?=(%s))" % "|".join(re.escape(term) for term in _CONFLICT_TERMS))
+
+
+def _scan_terms(text: str) -> Set[str]:
+    """Collect every conflict term found in a lower-cased text in one pass."""
+    return {match.group(1) for match in _CONFLICT_RE.finditer(text)}
+
 
 class CoordinatorAgent(BaseAgent):
+    # Rule generator shared by all coordinators, created on first use
+    _rule_generator = None
+
     def __init__(self):
         super().__init__()
         self.profile_file = os.path.join("data", "user_profiles.json")
-        self.feedback_file = os.path.join("data", "feedback_data.json")
-        self.rule_generator = DynamicRuleGenerator()
+        self.feedback_file = DB_FILE
+
+    @property
+    def rule_generator(self) -> DynamicRuleGenerator:
+        """Shared rule generator, created on first use."""
+        if CoordinatorAgent._rule_generator is None:
+            CoordinatorAgent._rule_generator = DynamicRuleGenerator()
+        return CoordinatorAgent._rule_generator
 
     def _initialize_data_files(self) -> None:
         """Initialize all required data files."""
         # Initialize user profiles if not exists
-        if not os.path.exists(self.profile_file):
-            with open(self.profile_file, 'w') as f:
-                json.dump({}, f)
-        # Initialize user feedback if not exists
-        if not os.path.exists(self.feedback_file):
-            with open(self.feedback_file, 'w') as f:
-                json.dump({}, f)
+        create_file_if_missing(self.profile_file, dumps({}))
+        # Initialize the feedback database if not exists
+        get_feedback_db()
 
     def load_profile_data(self) -> Dict[str, Any]:
         """Load profile data from the profile file."""
-        with open(self.profile_file, 'r') as f:
-            return json.load(f)
+        with open(self.profile_file, 'rb') as f:
+            return loads(f.read())
 
     def load_feedback_data(self) -> Dict[str, Any]:
-        """Load feedback data from the feedback file."""
-        with open(self.feedback_file, 'r') as f:
-            return json.load(f)
+        """Load feedback data from the feedback database."""
+        return load_feedback_data()
 
     def resolve_conflicts(self, profile_data: Optional[Dict[str, Any]] = None, feedback_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
@@ -57,15 +73,15 @@ class CoordinatorAgent(BaseAgent):
             }
         )
 
-        # Generate dynamic rules based on the current context
-        dynamic_rules = self.rule_generator.generate_rules(profile_data, feedback_data)
         conflicts = []
         resolutions = []
 
+        # Normalize each text once and scan it a single time for all terms
+        feedback_flags = _scan_terms(feedback_data.get("feedback", "").lower())
+        health_flags = _scan_terms(profile_data.get("health_info", "").lower())
+
         # Check for intensity conflicts with injuries
-        suggested_action = feedback_data.get("feedback", "").lower()
-        preferences = profile_data.get("health_info", "").lower()
-        if "high intensity" in suggested_action and "injury" in preferences:
+        if "high intensity" in feedback_flags and "injury" in health_flags:
             conflicts.append("Increase intensity conflicts with injury status")
             resolutions.append({
                 "adjustment": "Decrease intensity and suggest low-impact exercises",
@@ -73,10 +89,8 @@ class CoordinatorAgent(BaseAgent):
                 "priority": "high"
             })
 
-
         # Check for health conditions vs. exercise intensity
-        health_conditions = profile_data.get("health_info", "").lower()
-        if "high intensity" in suggested_action and ("heart_condition" in health_conditions or "asthma" in health_conditions):
+        if "high intensity" in feedback_flags and ("heart_condition" in health_flags or "asthma" in health_flags):
             conflicts.append("High-intensity workout conflicts with health condition")
             resolutions.append({
                 "adjustment": "Suggest low-intensity exercises",
@@ -85,9 +99,7 @@ class CoordinatorAgent(BaseAgent):
             })
 
         # Check for weather conditions vs. outdoor activities
-        weather_condition = feedback_data.get("feedback", "").lower()
-        workout_type = feedback_data.get("feedback", "").lower()
-        if "outdoor" in workout_type and ("rain" in weather_condition or "extreme_heat" in weather_condition):
+        if "outdoor" in feedback_flags and ("rain" in feedback_flags or "extreme_heat" in feedback_flags):
             conflicts.append("Outdoor workout conflicts with weather conditions")
             resolutions.append({
                 "adjustment": "Suggest indoor workouts",
@@ -95,7 +107,13 @@ class CoordinatorAgent(BaseAgent):
                 "priority": "medium"
             })
 
-
+        # Generate dynamic rules only when there is a conflict to resolve
+        dynamic_rules = {}
+        if conflicts:
+            dynamic_rules = self.rule_generator.generate_rules(
+                profile_data, feedback_data,
+                preloaded={"profile": profile_data}
+            )
 
         # Log conflicts and resolutions
         self.log_decision(
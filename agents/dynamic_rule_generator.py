@@ -1,14 +1,49 @@
-import json
 import os
 import csv
-from typing import Dict, Any, List
-from langchain_community.llms import Ollama
-from langchain.prompts import PromptTemplate
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple, TYPE_CHECKING
+from agents.feedback_agent import load_user_feedback
+from agents.llm import get_llm
+
+if TYPE_CHECKING:
+    from langchain.prompts import PromptTemplate
+    from langchain_community.llms import Ollama
+
+WORKOUT_FILE = os.path.join("data", "workouts.csv")
+PROGRESS_FILE = os.path.join("data", "progress_data.csv")
+
+# Shared pool for the independent, I/O-bound data loaders
+_LOADER_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="rule-loader")
+
+
+@functools.lru_cache(maxsize=4)
+def _load_workout_csv(path: str, signature: Tuple[int, int]) -> Tuple[Dict[str, Any], ...]:
+    """Parse the workout CSV; cached per file (mtime, size) signature."""
+    with open(path, mode='r') as file:
+        return tuple(csv.DictReader(file))
+
+
+@functools.lru_cache(maxsize=32)
+def _load_progress_csv(path: str, signature: Tuple[int, int], user_id: str) -> Tuple[Dict[str, Any], ...]:
+    """Parse one user's rows of the progress CSV; cached per file (mtime, size) signature."""
+    with open(path, mode='r') as file:
+        reader = csv.reader(file)
+        header = next(reader, None)
+        if not header:
+            return ()
+        # Compare the raw user_id column and only build dicts for matching rows
+        uid_idx = header.index('user_id')
+        return tuple(
+            dict(zip(header, row)) for row in reader
+            if len(row) > uid_idx and row[uid_idx] == user_id
+        )
+
 
 class DynamicRuleGenerator:
     def __init__(self):
-        self.llm = Ollama(model="llama3.2")
-        self.prompt = PromptTemplate.from_template("""
+        # Raw template string, formatted directly to skip PromptTemplate validation per call
+        self._prompt_str = """
         Based on the following user data and context, generate appropriate fallback rules:
         User Profile: {user_profile}
         Workout Data: {workout_data}
@@ -18,32 +53,54 @@ class DynamicRuleGenerator:
         Generate rules to resolve any conflicts and ensure the plan is adaptable to the user's needs.
         Don't Generate any Pseudo Code
         The output should be in Short summary.                                           
-        """)
+        """
+
+    @property
+    def prompt(self) -> "PromptTemplate":
+        """The rule prompt as a LangChain PromptTemplate, built on access."""
+        from langchain.prompts import PromptTemplate
+
+        return PromptTemplate.from_template(self._prompt_str)
+
+    @property
+    def llm(self) -> "Ollama":
+        """Shared Ollama client, created on first use."""
+        return get_llm("llama3.2")
 
-    def generate_rules(self, user_profile: Dict[str, Any], feedback_result: Dict[str, Any]) -> Dict[str, Any]:
+    def generate_rules(self, user_profile: Dict[str, Any], feedback_result: Dict[str, Any],
+                       *, preloaded: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Generate dynamic rules based on user profile and feedback data.
         Args:
             user_profile: The user's profile data
             feedback_result: The result of processing user feedback
+            preloaded: Data the caller has already loaded, keyed by "profile" and/or
+                       "feedback"; supplied entries are used instead of loading them again
         Returns:
             Dictionary containing generated rules and any relevant metadata
         """
-        # Load data from all sources
-        user_data = self._load_user_data(user_profile)
-        workout_data = self._load_workout_data()
+        preloaded = preloaded or {}
+
+        # Load data from all sources; the file-backed loaders run concurrently
+        workout_future = _LOADER_POOL.submit(self._load_workout_data)
+        progress_future = _LOADER_POOL.submit(self._load_progress_data, user_profile)
+        feedback_future = None
+        if "feedback" not in preloaded:
+            feedback_future = _LOADER_POOL.submit(self._load_feedback_data, user_profile)
+        user_data = preloaded["profile"] if "profile" in preloaded else self._load_user_data(user_profile)
         nutrition_data = self._load_nutrition_data(user_profile)
-        progress_data = self._load_progress_data(user_profile)
-        feedback_data = self._load_feedback_data(user_profile)
+        workout_data = workout_future.result()
+        progress_data = progress_future.result()
+        feedback_data = feedback_future.result() if feedback_future else preloaded["feedback"]
 
         # Prepare prompt for LLM
-        formatted_prompt = self.prompt.format(
-            user_profile=user_profile,
-            workout_data=workout_data,
-            nutrition_data=nutrition_data,
-            progress_data=progress_data,
-            feedback_data=feedback_data
-        )
+        formatted_prompt = self._prompt_str.format_map({
+            "user_profile": user_profile,
+            "workout_data": workout_data,
+            "nutrition_data": nutrition_data,
+            "progress_data": progress_data,
+            "feedback_data": feedback_data
+        })
 
         # Generate rules using LLM
         response = self.llm.invoke(formatted_prompt)
@@ -63,14 +120,12 @@ class DynamicRuleGenerator:
 
     def _load_workout_data(self) -> List[Dict[str, Any]]:
         """Load workout data from CSV file."""
-        workout_data = []
         try:
-            with open('data/workouts.csv', mode='r') as file:
-                reader = csv.DictReader(file)
-                workout_data = [row for row in reader]
+            stat = os.stat(WORKOUT_FILE)
         except FileNotFoundError:
             print("Workout data file not found. Using default workout data.")
-        return workout_data
+            return []
+        return list(_load_workout_csv(WORKOUT_FILE, (stat.st_mtime_ns, stat.st_size)))
 
     def _load_nutrition_data(self, user_profile: Dict[str, Any]) -> Dict[str, Any]:
         """Load nutrition data based on user profile."""
@@ -79,22 +134,15 @@ class DynamicRuleGenerator:
 
     def _load_progress_data(self, user_profile: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Load progress data for the user."""
-        progress_data = []
         try:
-            with open('data/progress_data.csv', mode='r') as file:
-                reader = csv.DictReader(file)
-                progress_data = [row for row in reader if row['user_id'] == user_profile.get("name")]
+            stat = os.stat(PROGRESS_FILE)
         except FileNotFoundError:
             print("Progress data file not found.")
-        return progress_data
+            return []
+        return list(_load_progress_csv(
+            PROGRESS_FILE, (stat.st_mtime_ns, stat.st_size), user_profile.get("name")
+        ))
 
     def _load_feedback_data(self, user_profile: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Load feedback data for the user."""
-        feedback_data = []
-        try:
-            with open('data/feedback_data.json', 'r') as file:
-                data = json.load(file)
-                feedback_data = data.get(user_profile.get("name"), [])
-        except FileNotFoundError:
-            print("Feedback data file not found.")
-        return feedback_data
+        return load_user_feedback(user_profile.get("name"))
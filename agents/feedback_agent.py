@@ -1,18 +1,190 @@
 import json
 import os
+import re
+import sqlite3
+import threading
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Set
+from urllib.parse import unquote
 from agents.base_agent import BaseAgent
+from agents.json_utils import dumps, loads
 
 DATA_FILE = os.path.join("data", "feedback_data.json")
+DB_FILE = os.path.join("data", "feedback.db")
+# Earlier file-based stores, imported into the database on first use
+FEEDBACK_DIR = os.path.join("data", "feedback")
+MEAL_FEEDBACK_FILE = os.path.join("data", "meal_feedback.jsonl")
+
+# Set once the feedback database has been opened in this process
+_INIT_DONE = False
+# sqlite3 connections are not shared between threads, so each thread keeps its own
+_db_local = threading.local()
+
+# Feedback keywords and the category tags they mark
+_KEYWORDS = {
+    "workout": ("workout",),
+    "hard": ("hard",), "intense": ("hard",), "difficult": ("hard",), "tough": ("hard",),
+    "easy": ("easy",), "simple": ("easy",), "light": ("easy",),
+    "meal": ("nutrition",), "food": ("nutrition",), "diet": ("nutrition",), "eat": ("nutrition",),
+    "fish": ("fish", "nutrition", "dietary"),
+    "chicken": ("chicken", "nutrition", "dietary"),
+    "vegetarian": ("vegetarian", "nutrition", "dietary"),
+    "vegan": ("vegan", "nutrition", "dietary"),
+    "only": ("exclusive",), "just": ("exclusive",),
+    "not tasty": ("taste",), "bad taste": ("taste",), "don't like": ("taste",), "disgusting": ("taste",),
+    "too much": ("portion",), "too large": ("portion",), "big portion": ("portion",),
+    "good": ("positive",), "great": ("positive",), "like": ("positive",), "enjoy": ("positive",)
+}
+# One precompiled literal alternation per category tag; CPython's regex engine
+# searches these faster than a separate substring check for every keyword
+_TAG_PATTERNS = {
+    tag: re.compile("|".join(re.escape(k) for k, tags in _KEYWORDS.items() if tag in tags))
+    for tag in {tag for tags in _KEYWORDS.values() for tag in tags}
+}
+
+
+def _scan_keywords(text: str) -> Set[str]:
+    """Collect the category tags of every keyword found in a lower-cased text"""
+    return {tag for tag, pattern in _TAG_PATTERNS.items() if pattern.search(text)}
+
+
+def get_feedback_db() -> sqlite3.Connection:
+    """Return this thread's connection to the feedback database, creating the schema on first use"""
+    conn = getattr(_db_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(DB_FILE), exist_ok=True)
+        conn = sqlite3.connect(DB_FILE)
+        # WAL keeps appends cheap and lets readers run alongside a writer
+        conn.execute("PRAGMA journal_mode=WAL")
+        _create_schema(conn)
+        _db_local.conn = conn
+    return conn
+
+
+def _create_schema(conn: sqlite3.Connection) -> None:
+    """Create the feedback tables and import the older file-based stores once"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS feedback ("
+            "id INTEGER PRIMARY KEY, user TEXT NOT NULL, ts TEXT NOT NULL, payload TEXT NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS feedback_user_ts ON feedback (user, ts)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS meal_feedback ("
+            "id INTEGER PRIMARY KEY, user TEXT NOT NULL, payload TEXT NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS meal_feedback_user ON meal_feedback (user)")
+        if conn.execute("PRAGMA user_version").fetchone()[0] == 0:
+            _migrate_legacy_feedback(conn)
+            conn.execute("PRAGMA user_version = 1")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def _read_jsonl(path: str) -> List[Dict[str, Any]]:
+    """Read every complete record of a JSON Lines file"""
+    entries = []
+    try:
+        with open(path, "rb") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entries.append(loads(line))
+                except json.JSONDecodeError:
+                    continue  # Skip a partially written line
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def _migrate_legacy_feedback(conn: sqlite3.Connection) -> None:
+    """Copy feedback from the per-user JSON Lines logs (or the older feedback_data.json) into the database"""
+    if os.path.isdir(FEEDBACK_DIR):
+        data = {
+            unquote(name[:-len(".jsonl")]): _read_jsonl(os.path.join(FEEDBACK_DIR, name))
+            for name in sorted(os.listdir(FEEDBACK_DIR)) if name.endswith(".jsonl")
+        }
+    else:
+        try:
+            with open(DATA_FILE, "rb") as f:
+                data = loads(f.read())
+        except (FileNotFoundError, json.JSONDecodeError):
+            data = {}
+    if isinstance(data, dict):
+        conn.executemany(
+            "INSERT INTO feedback (user, ts, payload) VALUES (?, ?, ?)",
+            [
+                (user_name, entry.get("timestamp", ""), dumps(entry).decode("utf-8"))
+                for user_name, entries in data.items() for entry in entries
+            ]
+        )
+    conn.executemany(
+        "INSERT INTO meal_feedback (user, payload) VALUES (?, ?)",
+        [(entry.get("user", ""), dumps(entry).decode("utf-8")) for entry in _read_jsonl(MEAL_FEEDBACK_FILE)]
+    )
+
+
+def store_feedback_entry(user_name: str, entry: Dict[str, Any]) -> None:
+    """Insert one feedback entry for a user"""
+    conn = get_feedback_db()
+    with conn:
+        conn.execute(
+            "INSERT INTO feedback (user, ts, payload) VALUES (?, ?, ?)",
+            (user_name, entry["timestamp"], dumps(entry).decode("utf-8"))
+        )
+
+
+def load_user_feedback(user_name: str) -> List[Dict[str, Any]]:
+    """Load a user's feedback entries in the order they were stored"""
+    if not user_name:
+        return []
+    rows = get_feedback_db().execute(
+        "SELECT payload FROM feedback WHERE user = ? ORDER BY id", (user_name,)
+    )
+    return [loads(payload) for (payload,) in rows]
+
+
+def load_recent_feedback(user_name: str, count: int) -> List[Dict[str, Any]]:
+    """Load a user's newest feedback entries, newest first"""
+    if not user_name:
+        return []
+    # The (user, ts) index serves the ordering, so only `count` rows are read
+    rows = get_feedback_db().execute(
+        "SELECT payload FROM feedback WHERE user = ? ORDER BY ts DESC, id LIMIT ?", (user_name, count)
+    )
+    return [loads(payload) for (payload,) in rows]
+
+
+def load_feedback_data() -> Dict[str, List[Dict[str, Any]]]:
+    """Build the aggregate {user: [entries]} feedback dictionary"""
+    data = {}
+    for user_name, payload in get_feedback_db().execute("SELECT user, payload FROM feedback ORDER BY id"):
+        data.setdefault(user_name, []).append(loads(payload))
+    return data
+
 
 class FeedbackAgent(BaseAgent):
+    # Common issues and the keyword tag that marks each, in matching priority order
+    _ISSUE_TAGS = (
+        ("workout_too_hard", "hard"),
+        ("workout_too_easy", "easy"),
+        ("meal_not_tasty", "taste"),
+        ("portion_too_large", "portion"),
+        ("dietary_preferences", "dietary"),
+        ("positive", "positive")
+    )
+
     def __init__(self):
         """Initialize the feedback agent with data storage"""
-        os.makedirs("data", exist_ok=True)
-        if not os.path.exists(DATA_FILE):
-            with open(DATA_FILE, "w") as f:
-                json.dump({}, f)
+        global _INIT_DONE
+        if not _INIT_DONE:
+            get_feedback_db()
+            _INIT_DONE = True
 
     def process_feedback(self, user_name: str, feedback_text: str) -> Dict[str, Any]:
         """
@@ -25,31 +197,12 @@ class FeedbackAgent(BaseAgent):
         Returns:
             Dictionary containing feedback processing results and suggested actions
         """
-        try:
-            # Load existing feedback data
-            with open(DATA_FILE, "r") as f:
-                data = json.load(f)
-        except:
-            data = {}
-
-        # Store the feedback with timestamp
-        feedback_entry = {
-            "feedback": feedback_text,
-            "timestamp": datetime.now().isoformat(),
-            "processed": False
-        }
-        data.setdefault(user_name, []).append(feedback_entry)
-
-        # Save updated feedback data
-        with open(DATA_FILE, "w") as f:
-            json.dump(data, f, indent=4)
-
         # Analyze feedback and determine action
-        feedback_lower = feedback_text.lower()
+        tags = _scan_keywords(feedback_text.lower())
         result = {
             "stored": True,
             "feedback_text": feedback_text,
-            "timestamp": feedback_entry["timestamp"],
+            "timestamp": datetime.now().isoformat(),
             "suggested_action": None,
             "adjustments_needed": False,
             "nutrition_adjustment": False,
@@ -59,91 +212,87 @@ class FeedbackAgent(BaseAgent):
         }
 
         # Workout-related feedback
-        if "workout" in feedback_lower:
-            if any(word in feedback_lower for word in ["hard", "intense", "difficult", "tough"]):
+        if "workout" in tags:
+            if "hard" in tags:
                 result["suggested_action"] = "decrease_intensity"
                 result["adjustments_needed"] = True
                 result["workout_adjustment"] = True
                 result["updated_profile"]["workout_intensity"] = "lower"
-            elif any(word in feedback_lower for word in ["easy", "simple", "light"]):
+            elif "easy" in tags:
                 result["suggested_action"] = "increase_intensity"
                 result["adjustments_needed"] = True
                 result["workout_adjustment"] = True
                 result["updated_profile"]["workout_intensity"] = "higher"
 
         # Nutrition-related feedback
-        elif any(word in feedback_lower for word in ["meal", "food", "diet", "eat", "fish", "chicken", "vegetarian", "vegan"]):
+        elif "nutrition" in tags:
             result["nutrition_adjustment"] = True
             result["adjustments_needed"] = True
 
             # Specific food preferences
-            if "fish" in feedback_lower and ("only" in feedback_lower or "just" in feedback_lower):
+            if "fish" in tags and "exclusive" in tags:
                 result["suggested_action"] = "fish_only_meals"
                 result["meal_preferences"] = {"protein_source": "fish", "exclusive": True}
                 result["updated_profile"]["dietary_preferences"] = {
                     "protein_source": "fish",
                     "restrictions": ["no_chicken", "no_mutton", "no_vegetarian"]
                 }
-            elif "chicken" in feedback_lower and ("only" in feedback_lower or "just" in feedback_lower):
+            elif "chicken" in tags and "exclusive" in tags:
                 result["suggested_action"] = "chicken_only_meals"
                 result["meal_preferences"] = {"protein_source": "chicken", "exclusive": True}
                 result["updated_profile"]["dietary_preferences"] = {
                     "protein_source": "chicken",
                     "restrictions": ["no_fish", "no_mutton", "no_vegetarian"]
                 }
-            elif "vegetarian" in feedback_lower:
+            elif "vegetarian" in tags:
                 result["suggested_action"] = "vegetarian_meals"
                 result["meal_preferences"] = {"diet_type": "vegetarian"}
                 result["updated_profile"]["dietary_preferences"] = {
                     "diet_type": "vegetarian",
                     "restrictions": ["no_meat", "no_fish", "no_chicken"]
                 }
-            elif "vegan" in feedback_lower:
+            elif "vegan" in tags:
                 result["suggested_action"] = "vegan_meals"
                 result["meal_preferences"] = {"diet_type": "vegan"}
                 result["updated_profile"]["dietary_preferences"] = {
                     "diet_type": "vegan",
                     "restrictions": ["no_meat", "no_fish", "no_chicken", "no_dairy", "no_eggs"]
                 }
-            elif any(word in feedback_lower for word in ["not tasty", "bad taste", "don't like", "disgusting"]):
+            elif "taste" in tags:
                 result["suggested_action"] = "change_meal"
                 result["meal_preferences"] = {"issue": "taste", "action": "replace"}
                 result["updated_profile"]["meal_preferences"] = "adjusted"
-            elif any(word in feedback_lower for word in ["too much", "too large", "big portion"]):
+            elif "portion" in tags:
                 result["suggested_action"] = "reduce_portion"
                 result["meal_preferences"] = {"issue": "portion", "action": "reduce"}
                 result["updated_profile"]["portion_size"] = "smaller"
 
         # General feedback
         else:
-            if any(word in feedback_lower for word in ["good", "great", "like", "enjoy"]):
+            if "positive" in tags:
                 result["suggested_action"] = "positive_feedback"
             else:
                 result["suggested_action"] = "recorded"
 
-        # Mark feedback as processed
-        feedback_entry["processed"] = True
-        feedback_entry["action_taken"] = result["suggested_action"]
-
-        # Save the updated feedback with processing status
-        with open(DATA_FILE, "w") as f:
-            json.dump(data, f, indent=4)
+        # Store the already processed feedback with a single insert
+        feedback_entry = {
+            "feedback": feedback_text,
+            "timestamp": result["timestamp"],
+            "processed": True,
+            "action_taken": result["suggested_action"],
+            "tags": sorted(tags)
+        }
+        store_feedback_entry(user_name, feedback_entry)
 
         return result
 
     def get_feedback_history(self, user_name: str) -> List[Dict[str, Any]]:
         """Get feedback history for a specific user"""
-        try:
-            with open(DATA_FILE, "r") as f:
-                data = json.load(f)
-            return data.get(user_name, [])
-        except:
-            return []
+        return load_user_feedback(user_name)
 
     def get_recent_feedback(self, user_name: str, count: int = 5) -> List[Dict[str, Any]]:
         """Get most recent feedback entries for a user"""
-        feedback = self.get_feedback_history(user_name)
-        return sorted(feedback, key=lambda x: x["timestamp"], reverse=True)[:count]
+        return load_recent_feedback(user_name, count)
 
     def get_common_issues(self, user_name: str) -> Dict[str, int]:
         """Analyze common feedback issues for a user"""
@@ -158,18 +307,13 @@ class FeedbackAgent(BaseAgent):
         }
 
         for entry in feedback:
-            text = entry["feedback"].lower()
-            if any(word in text for word in ["hard", "intense", "difficult", "tough"]):
-                issues["workout_too_hard"] += 1
-            elif any(word in text for word in ["easy", "simple", "light"]):
-                issues["workout_too_easy"] += 1
-            elif any(word in text for word in ["not tasty", "bad taste", "don't like", "disgusting"]):
-                issues["meal_not_tasty"] += 1
-            elif any(word in text for word in ["too much", "too large", "big portion"]):
-                issues["portion_too_large"] += 1
-            elif any(word in text for word in ["fish", "chicken", "vegetarian", "vegan"]):
-                issues["dietary_preferences"] += 1
-            elif any(word in text for word in ["good", "great", "like", "enjoy"]):
-                issues["positive"] += 1
+            # Entries keep the tags found when they were processed; only older
+            # entries without them need to be scanned again
+            tags = entry.get("tags")
+            tags = frozenset(tags) if tags is not None else _scan_keywords(entry["feedback"].lower())
+            for issue, tag in self._ISSUE_TAGS:
+                if tag in tags:
+                    issues[issue] += 1
+                    break
 
         return issues
@@ -0,0 +1,45 @@
+"""
+JSON helpers shared by the agents.
+
+orjson is used when it is installed; otherwise the standard library json
+module is used with compact separators. Both paths read and write bytes,
+so files should be opened in binary mode.
+"""
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize an object to compact JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+def dumps_pretty(obj: Any) -> bytes:
+    """Serialize an object to JSON bytes indented by two spaces, for files people read."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, indent=2).encode('utf-8')
+
+
+def dumps_line(obj: Any) -> bytes:
+    """Serialize an object to a single JSON Lines record, newline included."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+def loads(data: Any) -> Any:
+    """Parse JSON from bytes or str.
+
+    Invalid input raises json.JSONDecodeError (orjson's error subclasses it).
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -0,0 +1,32 @@
+"""
+Shared LLM clients for the agents.
+
+Clients are created on first use and reused by every agent in the
+process, so constructing an agent does not pay the client setup cost and
+calls to the Ollama server share one HTTP connection pool.
+"""
+import os
+import functools
+from typing import Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from langchain_community.llms import Ollama
+
+DEFAULT_MODEL = "llama3.2"
+
+
+def get_llm(model: Optional[str] = None) -> "Ollama":
+    """
+    Return the process-wide Ollama client for a model, creating it on first use.
+    Without a model, the OLLAMA_MODEL environment variable or DEFAULT_MODEL is used.
+    """
+    return _get_client(model or os.getenv("OLLAMA_MODEL", DEFAULT_MODEL))
+
+
+@functools.lru_cache(maxsize=None)
+def _get_client(model: str) -> "Ollama":
+    """One client per resolved model name."""
+    # Imported here so that modules which never call the LLM skip the langchain import
+    from langchain_community.llms import Ollama
+
+    return Ollama(model=model)
@@ -1,22 +1,76 @@
 import os
-import json
+import re
+import asyncio
+import threading
 import requests
-from typing import Dict, Any, List
-from langchain_community.llms import Ollama
-from langchain.prompts import PromptTemplate
+from collections import OrderedDict
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Dict, Any, List, Optional, TYPE_CHECKING
+from agents.feedback_agent import get_feedback_db
+from agents.json_utils import dumps, loads
+from agents.llm import get_llm
 
-FEEDBACK_FILE = os.path.join("data", "feedback_data.json")
+if TYPE_CHECKING:
+    from langchain.prompts import PromptTemplate
+    from langchain_community.llms import Ollama
+
+DEFAULT_NUTRITION = {"calories": 300, "protein": 20, "carbs": 30, "fat": 10}
+
+# Nutritionix results keyed by normalized meal name, least recently used first
+_NUTRITION_CACHE: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_NUTRITION_CACHE_SIZE = 4096
+# Agents in worker threads and in other sessions share the cache
+_NUTRITION_LOCK = threading.Lock()
+
+
+def _cached_nutrition(meal_norm: str) -> Optional[Dict[str, Any]]:
+    """Copy of the cached nutrition for a normalized meal name, if any."""
+    with _NUTRITION_LOCK:
+        cached = _NUTRITION_CACHE.get(meal_norm)
+        if cached is None:
+            return None
+        _NUTRITION_CACHE.move_to_end(meal_norm)
+        return dict(cached)
+
+
+def _store_nutrition(meal_norm: str, nutrition: Dict[str, Any]) -> None:
+    """Cache nutrition for a normalized meal name, evicting the least recently used when full."""
+    with _NUTRITION_LOCK:
+        _NUTRITION_CACHE[meal_norm] = nutrition
+        if len(_NUTRITION_CACHE) > _NUTRITION_CACHE_SIZE:
+            _NUTRITION_CACHE.popitem(last=False)
 
 class NutritionAgent:
+    # Predefined estimates for specific meals
+    _estimates = {
+        "avocado and egg omelette": {"cal": 731.82, "p": 29.76, "c": 33.04, "f": 55.94},
+        "cottage cheese with cucumber": {"cal": 139.79, "p": 13.55, "c": 11.64, "f": 4.93},
+        "grilled chicken with brown rice": {"cal": 420.66, "p": 60.76, "c": 28.52, "f": 7.64},
+        "carrot sticks with hummus": {"cal": 149.62, "p": 5.87, "c": 20.26, "f": 6.05},
+        "baked salmon with asparagus": {"cal": 889.44, "p": 84.99, "c": 23.56, "f": 48.72}
+    }
+    # One matcher over all estimate keys, built once for the class
+    _estimate_re = re.compile("|".join(re.escape(k) for k in sorted(_estimates, key=len, reverse=True)))
+
     def __init__(self):
         # Nutritionix API setup
         self.api_url = "https://trackapi.nutritionix.com/v2/natural/nutrients"
         self.app_id = os.getenv("NUTRITIONIX_APP_ID", "")
         self.api_key = os.getenv("NUTRITIONIX_API_KEY", "")
-        # LLM setup (Ollama via LangChain)
-        self.llm = Ollama(model="llama3.2")
-        # Prompt template
-        self.prompt = PromptTemplate.from_template("""
+        # Reuse one pooled HTTPS session so connections survive between lookups
+        self._session = requests.Session()
+        self._session.headers.update({
+            "x-app-id": self.app_id,
+            "x-app-key": self.api_key,
+            "Content-Type": "application/json"
+        })
+        # The natural-language lookup is read-only, so POST may be retried
+        retries = Retry(total=2, backoff_factor=0.2, allowed_methods=frozenset({"POST"}),
+                        status_forcelist=(429, 500, 502, 503, 504))
+        self._session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retries))
+        # Prompt template, as a raw string formatted directly to skip PromptTemplate validation per call
+        self._prompt_str = """
         Create a one-day meal plan with exactly 5 meals in this order:
         1. Breakfast
         2. Morning Snack
@@ -26,83 +80,163 @@ class NutritionAgent:
         For a {level} looking to {goal}. {preferences}
         {dietary_restrictions}
         Return just the meal names in order, one per line.
-        """)
-        os.makedirs(os.path.dirname(FEEDBACK_FILE), exist_ok=True)
-        if not os.path.exists(FEEDBACK_FILE):
-            with open(FEEDBACK_FILE, "w") as f:
-                json.dump([], f)
-
-    def _load_feedback(self) -> List[Dict[str, Any]]:
-        """Safely load feedback JSON"""
-        try:
-            with open(FEEDBACK_FILE, "r") as f:
-                data = json.load(f)
-                if isinstance(data, list):
-                    return data
-                else:
-                    return []
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
+        """
+
+    @property
+    def prompt(self) -> "PromptTemplate":
+        """The meal prompt as a LangChain PromptTemplate, built on access"""
+        from langchain.prompts import PromptTemplate
+
+        return PromptTemplate.from_template(self._prompt_str)
+
+    @property
+    def llm(self) -> "Ollama":
+        """Shared Ollama client (via LangChain), created on first use"""
+        return get_llm("llama3.2")
+
+    def _load_feedback(self, user: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Load meal feedback entries, keeping only one user's when given"""
+        db = get_feedback_db()
+        if user is None:
+            rows = db.execute("SELECT payload FROM meal_feedback ORDER BY id")
+        else:
+            rows = db.execute("SELECT payload FROM meal_feedback WHERE user = ? ORDER BY id", (user,))
+        return [loads(payload) for (payload,) in rows]
 
     def _save_feedback(self, feedback_data: List[Dict[str, Any]]):
-        """Save feedback back to JSON"""
-        with open(FEEDBACK_FILE, "w") as f:
-            json.dump(feedback_data, f, indent=4)
+        """Replace all stored meal feedback"""
+        db = get_feedback_db()
+        with db:
+            db.execute("DELETE FROM meal_feedback")
+            db.executemany(
+                "INSERT INTO meal_feedback (user, payload) VALUES (?, ?)",
+                [(entry.get("user", ""), dumps(entry).decode("utf-8")) for entry in feedback_data]
+            )
 
     def store_feedback(self, user: str, feedback: str):
         """Add new feedback entry for a user"""
-        feedback_data = self._load_feedback()
-        feedback_data.append({"user": user, "feedback": feedback})
-        self._save_feedback(feedback_data)
+        db = get_feedback_db()
+        with db:
+            db.execute(
+                "INSERT INTO meal_feedback (user, payload) VALUES (?, ?)",
+                (user, dumps({"user": user, "feedback": feedback}).decode("utf-8"))
+            )
 
-    def _fetch_nutrition(self, meal: str) -> Dict[str, Any]:
-        """Fetch nutrition data with fallback estimates"""
-        # Predefined estimates for specific meals
-        estimates = {
-            "avocado and egg omelette": {"cal": 731.82, "p": 29.76, "c": 33.04, "f": 55.94},
-            "cottage cheese with cucumber": {"cal": 139.79, "p": 13.55, "c": 11.64, "f": 4.93},
-            "grilled chicken with brown rice": {"cal": 420.66, "p": 60.76, "c": 28.52, "f": 7.64},
-            "carrot sticks with hummus": {"cal": 149.62, "p": 5.87, "c": 20.26, "f": 6.05},
-            "baked salmon with asparagus": {"cal": 889.44, "p": 84.99, "c": 23.56, "f": 48.72}
-        }
-        # Check if the meal matches any predefined estimates
-        for key, values in estimates.items():
-            if key in meal.lower():
-                return {
-                    "calories": values["cal"],
-                    "protein": values["p"],
-                    "carbs": values["c"],
-                    "fat": values["f"]
-                }
-        # If no match, try to fetch from Nutritionix API
-        if not self.app_id or not self.api_key:
-            return {"calories": 300, "protein": 20, "carbs": 30, "fat": 10}
-        headers = {
-            "x-app-id": self.app_id,
-            "x-app-key": self.api_key,
-            "Content-Type": "application/json"
+    def _estimate_nutrition(self, meal_norm: str) -> Optional[Dict[str, Any]]:
+        """Look up a normalized meal name in the predefined estimates"""
+        # Stop at the first estimate key found in the meal
+        match = self._estimate_re.search(meal_norm)
+        if match is None:
+            return None
+        values = self._estimates[match.group(0)]
+        return {
+            "calories": values["cal"],
+            "protein": values["p"],
+            "carbs": values["c"],
+            "fat": values["f"]
         }
+
+    def _request_foods(self, query: str) -> List[Dict[str, Any]]:
+        """Send one natural-language query to Nutritionix and return the matched foods"""
+        response = self._session.post(self.api_url, json={"query": query}, timeout=5)
+        response.raise_for_status()
+        return response.json().get("foods") or []
+
+    @staticmethod
+    def _match_foods(queries: List[str], foods: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        """
+        First returned food named in each query line. Foods come back in line order,
+        so each line only considers the foods after the one matched for the line before.
+        """
+        items: List[Optional[Dict[str, Any]]] = []
+        start = 0
+        for query in queries:
+            line = query.lower()
+            item = None
+            for j in range(start, len(foods)):
+                name = (foods[j].get("food_name") or "").lower()
+                if name and name in line:
+                    item = foods[j]
+                    start = j + 1
+                    break
+            items.append(item)
+        return items
+
+    def _lookup_nutrition(self, queries: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Fetch nutrition for uncached meals, batching them into a single Nutritionix request"""
         try:
-            response = requests.post(
-                self.api_url,
-                headers=headers,
-                json={"query": meal}
-            )
-            response.raise_for_status()
-            data = response.json()
-            if "foods" in data and data["foods"]:
-                item = data["foods"][0]
-                return {
+            # Nutritionix accepts one food per line, so all meals go in one request
+            foods = self._request_foods("\n".join(queries))
+            if len(queries) == 1:
+                items = foods[:1]
+            else:
+                # A line can match several foods or none, so map them back by name
+                items = self._match_foods(queries, foods)
+        except requests.exceptions.RequestException as e:
+            print(f"Failed to fetch nutrition data: {e}")
+            return {query: dict(DEFAULT_NUTRITION) for query in queries}
+
+        results = {}
+        for i, query in enumerate(queries):
+            item = items[i] if i < len(items) else None
+            if item:
+                nutrition = {
                     "calories": item.get("nf_calories", 300),
                     "protein": item.get("nf_protein", 20),
                     "carbs": item.get("nf_total_carbohydrate", 30),
                     "fat": item.get("nf_total_fat", 10)
                 }
             else:
-                return {"calories": 300, "protein": 20, "carbs": 30, "fat": 10}
-        except requests.exceptions.RequestException as e:
-            print(f"Failed to fetch nutrition data: {e}")
-            return {"calories": 300, "protein": 20, "carbs": 30, "fat": 10}
+                # Not cached, so a line missed this time is looked up again next time
+                results[query] = dict(DEFAULT_NUTRITION)
+                continue
+            results[query] = nutrition
+            _store_nutrition(query, nutrition)
+        return results
+
+    def _fetch_nutrition_batch(self, meals: List[str]) -> List[Dict[str, Any]]:
+        """Fetch nutrition data for several meals with fallback estimates"""
+        results: List[Optional[Dict[str, Any]]] = [None] * len(meals)
+        misses: Dict[str, List[int]] = {}
+        for i, meal in enumerate(meals):
+            # Normalize once for both the estimate match and the cache key
+            meal_norm = meal.lower().strip()
+            estimate = self._estimate_nutrition(meal_norm)
+            if estimate is not None:
+                results[i] = estimate
+                continue
+            # If no match, the Nutritionix API is needed
+            if not self.app_id or not self.api_key:
+                results[i] = dict(DEFAULT_NUTRITION)
+                continue
+            cached = _cached_nutrition(meal_norm)
+            if cached is not None:
+                results[i] = cached
+            else:
+                misses.setdefault(meal_norm, []).append(i)
+
+        if misses:
+            for meal_norm, nutrition in self._lookup_nutrition(list(misses)).items():
+                for i in misses[meal_norm]:
+                    results[i] = dict(nutrition)
+        return results
+
+    def _fetch_nutrition(self, meal: str) -> Dict[str, Any]:
+        """Fetch nutrition data with fallback estimates"""
+        return self._fetch_nutrition_batch([meal])[0]
+
+    async def agenerate_meal_plan(self, user_profile: Dict[str, Any]) -> Dict[str, Any]:
+        """Async variant of generate_meal_plan; LLM and nutrition lookups run in a worker thread"""
+        return await asyncio.to_thread(self.generate_meal_plan, user_profile)
+
+    def _dietary_restrictions(self, user_profile: Dict[str, Any]) -> str:
+        """Prompt restriction derived from the dietary preferences set by feedback"""
+        dietary_prefs = user_profile.get("dietary_preferences", {})
+        if dietary_prefs.get("protein_source") == "fish":
+            return "All meals must include fish as the primary protein source."
+        elif dietary_prefs.get("diet_type") == "vegetarian":
+            return "All meals must be vegetarian (no meat, fish, or poultry)."
+        return ""
 
     def generate_meal_plan(self, user_profile: Dict[str, Any]) -> Dict[str, Any]:
         """Generate categorized meal plan"""
@@ -110,33 +244,26 @@ class NutritionAgent:
         goal = user_profile.get("goal", "maintain health")
         level = user_profile.get("level", "beginner")
         preferences = user_profile.get("meal_preference", "")
-        dietary_restrictions = ""
         # Get dietary preferences from feedback
-        dietary_prefs = user_profile.get("dietary_preferences", {})
-        if dietary_prefs.get("protein_source") == "fish":
-            dietary_restrictions = "All meals must include fish as the primary protein source."
-        elif dietary_prefs.get("diet_type") == "vegetarian":
-            dietary_restrictions = "All meals must be vegetarian (no meat, fish, or poultry)."
+        dietary_restrictions = self._dietary_restrictions(user_profile)
 
         # Apply past feedback
-        feedback_data = self._load_feedback()
-        user_name = user_profile.get("name")
-        user_feedback = [f["feedback"] for f in feedback_data if f["user"] == user_name]
+        user_feedback = [f["feedback"] for f in self._load_feedback(user_profile.get("name"))]
         if user_feedback:
             preferences += " Past feedback: " + "; ".join(user_feedback)
 
         # Generate meals using LLM
-        formatted_prompt = self.prompt.format(
-            goal=goal, level=level, preferences=preferences,
-            dietary_restrictions=dietary_restrictions
-        )
+        formatted_prompt = self._prompt_str.format_map({
+            "goal": goal, "level": level, "preferences": preferences,
+            "dietary_restrictions": dietary_restrictions
+        })
         response = self.llm.invoke(formatted_prompt)
         meal_descriptions = [m.strip() for m in response.split('\n') if m.strip()][:5]
         # Categorize meals
         meal_types = ["Breakfast", "Morning Snack", "Lunch", "Afternoon Snack", "Dinner"]
         meal_plan = []
-        for i, (meal_type, meal) in enumerate(zip(meal_types, meal_descriptions)):
-            nutrition = self._fetch_nutrition(meal)
+        nutritions = self._fetch_nutrition_batch(meal_descriptions[:len(meal_types)])
+        for meal_type, meal, nutrition in zip(meal_types, meal_descriptions, nutritions):
             meal_plan.append({
                 "type": meal_type,
                 "description": meal,
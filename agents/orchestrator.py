@@ -4,12 +4,14 @@ from agents.nutrition_agent import NutritionAgent
 from agents.progress_agent import ProgressAgent
 from agents.feedback_agent import FeedbackAgent
 from agents.coordinator_agent import CoordinatorAgent
-from agents.dynamic_rule_generator import DynamicRuleGenerator
-from datetime import datetime
-from typing import Dict, Any
-import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterator, Tuple
+import asyncio
 
 class Orchestrator:
+    # Worker threads for blocking agent calls, shared by all orchestrators
+    _pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="orchestrator")
+
     def __init__(self):
         self.profile_agent = ProfileAgent()
         self.workout_agent = WorkoutAgent()
@@ -17,11 +19,11 @@ class Orchestrator:
         self.progress_agent = ProgressAgent()
         self.feedback_agent = FeedbackAgent()
         self.coordinator_agent = CoordinatorAgent()
-        self.dynamic_rule_generator = DynamicRuleGenerator()
 
-    def run(self, user_profile: Dict[str, Any], feedback_text: str = None) -> Dict[str, Any]:
-        user_id = user_profile.get("name", "Unknown")
-        result = {
+    @staticmethod
+    def _new_result(user_profile: Dict[str, Any]) -> Dict[str, Any]:
+        """Empty result dict for a run."""
+        return {
             "profile": user_profile,
             "workout_text": "",
             "nutrition_text": "",
@@ -33,13 +35,51 @@ class Orchestrator:
             "dynamic_rules": None
         }
 
+    def _add_progress(self, result: Dict[str, Any], user_name: str) -> None:
+        """Load the user's progress into the result."""
+        result["progress"] = self.progress_agent.load_progress(user_name)
+        result["progress_text"] = "\n".join(p["_line"] for p in result["progress"])
+
+    def run(self, user_profile: Dict[str, Any], feedback_text: str = None) -> Dict[str, Any]:
+        return asyncio.run(self.run_async(user_profile, feedback_text))
+
+    def run_stream(self, user_profile: Dict[str, Any]) -> Iterator[Tuple[str, Any]]:
+        """
+        Generate plans like run without feedback, streaming the workout plan.
+        Yields ("workout", chunk) while the workout plan is generated, then
+        ("result", result) with the same dict run returns.
+        """
+        result = self._new_result(user_profile)
+        self.profile_agent.update_profile({user_profile["name"]: user_profile})
+
+        # The meal plan is generated in the background while the workout plan streams
+        nutrition_future = self._pool.submit(self.nutrition_agent.generate_meal_plan, user_profile)
+        chunks = []
+        for chunk in self.workout_agent.stream_plan(user_profile):
+            chunks.append(chunk)
+            yield "workout", chunk
+        result["workout_text"] = "".join(chunks).strip()
+
+        nutrition_result = nutrition_future.result()
+        result["nutrition_json"] = nutrition_result
+        result["nutrition_text"] = nutrition_result.get("plan_text", "")
+
+        self._add_progress(result, user_profile["name"])
+        yield "result", result
+
+    async def run_async(self, user_profile: Dict[str, Any], feedback_text: str = None) -> Dict[str, Any]:
+        user_id = user_profile.get("name", "Unknown")
+        result = self._new_result(user_profile)
+
         # Update user profile
         self.profile_agent.update_profile({user_profile["name"]: user_profile})
 
-        # --- Generate initial workout and nutrition plans ---
-        workout_text = self.workout_agent.generate_plan(user_profile)
+        # --- Generate initial workout and nutrition plans (independent, so run concurrently) ---
+        workout_text, nutrition_result = await asyncio.gather(
+            self.workout_agent.agenerate_plan(user_profile),
+            self.nutrition_agent.agenerate_meal_plan(user_profile)
+        )
         result["workout_text"] = workout_text
-        nutrition_result = self.nutrition_agent.generate_meal_plan(user_profile)
         result["nutrition_json"] = nutrition_result
         result["nutrition_text"] = nutrition_result.get("plan_text", "")
 
@@ -52,42 +92,52 @@ class Orchestrator:
 
             # Update profile with feedback preferences
             updated_profile = {**user_profile, **feedback_result.get("updated_profile", {})}
-            self.profile_agent.update_profile({user_profile["name"]: updated_profile})
+            loop = asyncio.get_running_loop()
+
+            # --- Adjust nutrition plan based on feedback ---
+            # It only depends on the feedback, so it starts before conflict resolution
+            nutrition_task = None
+            if feedback_result.get("nutrition_adjustment", False):
+                nutrition_task = asyncio.ensure_future(
+                    self.nutrition_agent.agenerate_meal_plan(updated_profile)
+                )
+
+            # Saving the profile and resolving conflicts are independent of each other
+            # The profile file was just written above, so start from the cached profiles
+            profile_future = loop.run_in_executor(
+                self._pool, self.profile_agent.update_profile_from_cache, {user_profile["name"]: updated_profile}
+            )
 
             # --- Resolve conflicts using Coordinator Agent ---
-            conflict_resolution = self.coordinator_agent.resolve_conflicts(updated_profile, feedback_result)
+            conflict_resolution = await loop.run_in_executor(
+                self._pool, self.coordinator_agent.resolve_conflicts, updated_profile, feedback_result
+            )
             result["conflict_resolution"] = conflict_resolution
 
-            # --- Generate dynamic rules if conflicts exist ---
+            # --- Use dynamic rules if conflicts exist ---
+            # The coordinator already generated them from the same profile and feedback
             dynamic_rules = None
             if conflict_resolution.get("conflicts"):
-                dynamic_rules = self.dynamic_rule_generator.generate_rules(updated_profile, feedback_result)
+                dynamic_rules = conflict_resolution.get("dynamic_rules")
                 result["dynamic_rules"] = dynamic_rules
 
             # --- Adjust workout plan based on conflict resolution and dynamic rules ---
-            if conflict_resolution.get("resolutions") or dynamic_rules is not None:
-                workout_text = self.workout_agent.generate_plan(
+            # Empty resolutions and rules would reproduce the initial plan, so they are skipped
+            if conflict_resolution.get("resolutions") or dynamic_rules:
+                result["workout_text"] = await self.workout_agent.agenerate_plan(
                     user_profile=updated_profile,
                     conflict_resolutions=conflict_resolution.get("resolutions", []),
                     dynamic_rules=dynamic_rules
                 )
-                result["workout_text"] = workout_text
 
-            # --- Adjust nutrition plan based on feedback ---
-            if feedback_result.get("nutrition_adjustment", False):
-                nutrition_result = self.nutrition_agent.generate_meal_plan(updated_profile)
+            await profile_future
+            if nutrition_task is not None:
+                nutrition_result = await nutrition_task
                 result["nutrition_json"] = nutrition_result
                 result["nutrition_text"] = nutrition_result.get("plan_text", "")
 
         # --- Load progress data ---
-        result["progress"] = self.progress_agent.load_progress(user_profile["name"])
-        result["progress_text"] = "\n".join([
-            f"Day {p.get('day', '-')} | {p.get('timestamp', '-')} | "
-            f"Weight: {p.get('weight', '-')}kg | "
-            f"Duration: {p.get('duration_min', '-')}min | "
-            f"Calories: {p.get('calories_burned', '-')}"
-            for p in result["progress"]
-        ])
+        self._add_progress(result, user_profile["name"])
 
         return result
 
@@ -1,44 +1,163 @@
 # agents/profile_agent.py
 import json
 import os
-from typing import Dict, Any
+import functools
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import quote, unquote
 from datetime import datetime, timedelta
-from agents.base_agent import BaseAgent
+from agents.base_agent import BaseAgent, create_file_if_missing
+from agents.json_utils import dumps, dumps_line, dumps_pretty, loads
 
 DATA_FILE = os.path.join("data", "user_profiles.json")
+# Per-user progress entries appended since the profile file was last written
+PROGRESS_DIR = os.path.join("data", "progress")
+
+# Set once the profile file has been checked in this process
+_INIT_DONE = False
+# Serializes progress appends with folding them into the profile file
+_progress_lock = threading.Lock()
+# Held across each read-modify-write of the profiles, so concurrent updates
+# (e.g. a sidebar save during a background feedback run) do not overwrite each other
+_profile_lock = threading.RLock()
+
+
+def _progress_log_path(user_id: str) -> str:
+    """Path of a user's pending progress log; the user id is quoted to be a safe file name."""
+    return os.path.join(PROGRESS_DIR, quote(user_id, safe='') + '.jsonl')
+
+
+def append_progress_entry(user_id: str, entry: Dict[str, Any]) -> None:
+    """Append one progress entry for a user without rewriting the profile file."""
+    with _progress_lock:
+        os.makedirs(PROGRESS_DIR, exist_ok=True)
+        with open(_progress_log_path(user_id), 'ab') as f:
+            f.write(dumps_line(entry))
+
+
+def load_progress_entries(user_id: str) -> List[Dict[str, Any]]:
+    """Progress entries for a user that are not yet in the profile file."""
+    try:
+        with open(_progress_log_path(user_id), 'rb') as f:
+            return [loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def _pending_progress() -> Dict[str, List[Dict[str, Any]]]:
+    """All pending progress entries, keyed by user id."""
+    try:
+        names = os.listdir(PROGRESS_DIR)
+    except FileNotFoundError:
+        return {}
+    return {
+        unquote(name[:-len('.jsonl')]): load_progress_entries(unquote(name[:-len('.jsonl')]))
+        for name in names if name.endswith('.jsonl')
+    }
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse_iso(value: str) -> Optional[datetime]:
+    """Parse an ISO timestamp once per distinct string; invalid strings give None."""
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def _parse_plan_end(value: Any) -> Optional[datetime]:
+    """Parsed plan_end_date, or None if it is not a valid ISO timestamp string."""
+    return _parse_iso(value) if isinstance(value, str) else None
+
+
+def _with_progress(profiles: Dict[str, Any], pending: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
+    """Copy of the profiles with pending progress entries appended, leaving the input untouched."""
+    if not pending:
+        return profiles
+    profiles = dict(profiles)
+    for user_id, entries in pending.items():
+        profile = dict(profiles.get(user_id) or {})
+        profile['progress'] = [*profile.get('progress', []), *entries]
+        profiles[user_id] = profile
+    return profiles
 
 class ProfileAgent(BaseAgent):
+    # Parsed profiles shared by all instances, valid while the file's stat matches
+    _cache: Optional[Dict[str, Any]] = None
+    _cache_mtime: Optional[Tuple[int, int]] = None
+
     def __init__(self):
         super().__init__()
-        os.makedirs("data", exist_ok=True)
-        self._initialize_profile_file()
+        global _INIT_DONE
+        if not _INIT_DONE:
+            self._initialize_profile_file()
+            _INIT_DONE = True
 
     def _initialize_profile_file(self):
         """Initialize the profile file if it doesn't exist."""
-        if not os.path.exists(DATA_FILE):
-            with open(DATA_FILE, 'w') as f:
-                json.dump({}, f)
+        if create_file_if_missing(DATA_FILE, b'{}'):
             self.log_decision("system", "Initialized user profiles file")
 
+    @staticmethod
+    def _file_signature() -> Tuple[int, int]:
+        """Modification time and size identifying the current profile file contents."""
+        st = os.stat(DATA_FILE)
+        return st.st_mtime_ns, st.st_size
+
+    @classmethod
+    def _set_cache(cls, profiles: Dict[str, Any]) -> None:
+        """Remember the profiles just written or parsed for the current file contents."""
+        cls._cache = dict(profiles)
+        cls._cache_mtime = cls._file_signature()
+
+    def _write_profiles(self, profiles: Dict[str, Any]) -> None:
+        """Write all profiles, folding in and clearing the pending progress logs."""
+        with _progress_lock:
+            pending = _pending_progress()
+            profiles = _with_progress(profiles, pending)
+            # Write compact JSON to a temporary file and swap it in, so readers never see a partial file
+            tmp_file = f"{DATA_FILE}.{os.getpid()}.tmp"
+            with open(tmp_file, 'wb') as f:
+                f.write(dumps(profiles))
+            os.replace(tmp_file, DATA_FILE)
+            self._set_cache(profiles)
+            for user_id in pending:
+                os.remove(_progress_log_path(user_id))
+
     def save_user_profile(self, user_data: Dict[str, Any]) -> None:
         """Save the entire user profiles dictionary to the file."""
         try:
-            with open(DATA_FILE, 'w') as f:
-                json.dump(user_data, f, indent=4)
+            with _profile_lock:
+                self._write_profiles(user_data)
             self.log_decision("system", "Saved all user profiles")
         except Exception as e:
             self.log_decision("system", f"Failed to save profiles: {str(e)}")
             raise
 
+    def export_pretty(self, path: str) -> None:
+        """Write all profiles, including pending progress, as indented JSON for people to read."""
+        profiles = _with_progress(self.load_user_profile(), _pending_progress())
+        with open(path, 'wb') as f:
+            f.write(dumps_pretty(profiles))
+        self.log_decision("system", f"Exported user profiles to {path}")
+
     def load_user_profile(self) -> Dict[str, Any]:
-        """Load all user profiles from the file."""
+        """
+        Load all user profiles from the file.
+        The file is only re-parsed when it changed; the returned dict is a fresh
+        copy, but the per-user profiles inside it are shared and must not be mutated.
+        """
         try:
-            with open(DATA_FILE, 'r') as f:
-                profiles = json.load(f)
+            if ProfileAgent._cache is not None and ProfileAgent._cache_mtime == self._file_signature():
+                self.log_decision("system", "Loaded user profiles")
+                return dict(ProfileAgent._cache)
+            with open(DATA_FILE, 'rb') as f:
+                profiles = loads(f.read())
                 # Ensure we return a dictionary
                 if not isinstance(profiles, dict):
                     self.log_decision("system", "Profile file corrupted, returning empty dict")
                     return {}
+            self._set_cache(profiles)
             self.log_decision("system", "Loaded user profiles")
             return profiles
         except (FileNotFoundError, json.JSONDecodeError):
@@ -47,21 +166,46 @@ class ProfileAgent(BaseAgent):
 
     def update_profile(self, new_profile: Dict[str, Any]) -> str:
         """Update or add a new profile to the existing profiles."""
-        profiles = self.load_user_profile()
+        with _profile_lock:
+            return self._apply_update(self.load_user_profile(), new_profile)
 
+    def update_profile_from_cache(self, new_profile: Dict[str, Any]) -> str:
+        """
+        Update profiles starting from the ones this process last read or wrote,
+        skipping the check of the file. Only use it right after another update,
+        when no other process can have written the file in between.
+        """
+        with _profile_lock:
+            if ProfileAgent._cache is None:
+                return self.update_profile(new_profile)
+            return self._apply_update(dict(ProfileAgent._cache), new_profile)
+
+    def _apply_update(self, profiles: Dict[str, Any], new_profile: Dict[str, Any]) -> str:
+        """Merge new profiles into the given ones and save the result."""
         # Validate input
         if not isinstance(new_profile, dict):
             self.log_decision("system", "Invalid profile data received")
             raise ValueError("Profile data must be a dictionary")
 
-        for user_id, profile_data in new_profile.items():
-            self.log_decision(
-                user_id=user_id,
-                action="Updating profile",
-                metadata={"updated_fields": list(profile_data.keys())}
-            )
+        # One log record for the whole update, attributed to the user when there is only one
+        self.log_decision(
+            user_id=next(iter(new_profile)) if len(new_profile) == 1 else "system",
+            action="Updating profile",
+            metadata={
+                "updated_fields": {
+                    user_id: list(profile_data.keys()) for user_id, profile_data in new_profile.items()
+                }
+            }
+        )
 
-        profiles.update(new_profile)
+        # Progress is only ever appended through the progress logs, so the stored list is
+        # kept; an incoming copy may predate entries folded in since it was read
+        for user_id, profile_data in new_profile.items():
+            stored_progress = (profiles.get(user_id) or {}).get('progress')
+            profile_data = {k: v for k, v in profile_data.items() if k != 'progress'}
+            if stored_progress is not None:
+                profile_data['progress'] = stored_progress
+            profiles[user_id] = profile_data
         self.save_user_profile(profiles)
         return "Profile updated successfully."
 
@@ -80,10 +224,9 @@ class ProfileAgent(BaseAgent):
         # Safely check plan expiration
         plan_expired = False
         if user_data.get('plan_end_date'):
-            try:
-                plan_expired = datetime.fromisoformat(user_data['plan_end_date']) < datetime.now()
-            except (TypeError, ValueError):
-                pass
+            plan_end = _parse_plan_end(user_data['plan_end_date'])
+            if plan_end is not None:
+                plan_expired = plan_end < datetime.now()
 
         self.log_decision(
             user_id=user_id,
@@ -99,7 +242,7 @@ class ProfileAgent(BaseAgent):
             'nutrition_plan': user_data.get('nutrition_plan', {}),
             'plan_start_date': user_data.get('plan_start_date'),
             'plan_end_date': user_data.get('plan_end_date'),
-            'progress': user_data.get('progress', [])
+            'progress': user_data.get('progress', []) + load_progress_entries(user_id)
         }
 
     def update_plan_status(self, user_id: str, plan_data: Dict[str, Any]) -> None:
@@ -118,38 +261,41 @@ class ProfileAgent(BaseAgent):
             metadata={"new_plan": bool(plan_data)}
         )
 
-        profiles = self.load_user_profile()
-        if user_id not in profiles:
-            profiles[user_id] = {}
+        with _profile_lock:
+            profiles = self.load_user_profile()
+            # Copy the user's profile rather than mutating the cached one
+            profiles[user_id] = dict(profiles.get(user_id, {}))
 
-        # Safely update plan data
-        try:
-            profiles[user_id].update({
-                'workout_plan': plan_data.get('workout_plan', {}),
-                'nutrition_plan': plan_data.get('nutrition_plan', {}),
-                'plan_start_date': datetime.now().isoformat(),
-                'plan_end_date': (datetime.now() + timedelta(days=7)).isoformat(),
-                'last_updated': datetime.now().isoformat()
-            })
+            # Safely update plan data
+            try:
+                # One timestamp for all fields, so start and last_updated agree exactly
+                now = datetime.now()
+                now_iso = now.isoformat()
+                profiles[user_id].update({
+                    'workout_plan': plan_data.get('workout_plan', {}),
+                    'nutrition_plan': plan_data.get('nutrition_plan', {}),
+                    'plan_start_date': now_iso,
+                    'plan_end_date': (now + timedelta(days=7)).isoformat(),
+                    'last_updated': now_iso
+                })
 
-            with open(DATA_FILE, 'w') as f:
-                json.dump(profiles, f, indent=4)
+                self._write_profiles(profiles)
 
-            self.log_decision(
-                user_id=user_id,
-                action="Plan status updated",
-                metadata={
-                    "plan_duration": "7_days",
-                    "plan_types": list(plan_data.keys())
-                }
-            )
-        except Exception as e:
-            self.log_decision(
-                user_id=user_id,
-                action="Failed to update plan status",
-                metadata={"error": str(e)}
-            )
-            raise
+                self.log_decision(
+                    user_id=user_id,
+                    action="Plan status updated",
+                    metadata={
+                        "plan_duration": "7_days",
+                        "plan_types": list(plan_data.keys())
+                    }
+                )
+            except Exception as e:
+                self.log_decision(
+                    user_id=user_id,
+                    action="Failed to update plan status",
+                    metadata={"error": str(e)}
+                )
+                raise
 
     def check_plan_expiration(self, user_id: str) -> bool:
         """Check if user's current plan has expired."""
@@ -158,18 +304,19 @@ class ProfileAgent(BaseAgent):
             self.log_decision(user_id, "No active plan found")
             return True
 
-        try:
-            is_expired = datetime.fromisoformat(status['plan_end_date']) < datetime.now()
-            self.log_decision(
-                user_id=user_id,
-                action="Checked plan expiration",
-                metadata={"is_expired": is_expired}
-            )
-            return is_expired
-        except (TypeError, ValueError):
+        plan_end = _parse_plan_end(status['plan_end_date'])
+        if plan_end is None:
             self.log_decision(
                 user_id=user_id,
                 action="Failed to check plan expiration",
                 reason="Invalid date format"
             )
             return True
+
+        is_expired = plan_end < datetime.now()
+        self.log_decision(
+            user_id=user_id,
+            action="Checked plan expiration",
+            metadata={"is_expired": is_expired}
+        )
+        return is_expired
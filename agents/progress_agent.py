@@ -1,39 +1,107 @@
 import os
 import csv
-import json
-from typing import Dict, Any, List
+import threading
+from typing import Dict, Any, List, Optional, Set, Tuple
 from datetime import datetime
-import pandas as pd
-from langchain_community.llms import Ollama
-from langchain.prompts import PromptTemplate
-from agents.base_agent import BaseAgent
+from agents.base_agent import BaseAgent, create_file_if_missing
+from agents.profile_agent import append_progress_entry
+from agents.llm import get_llm
+
+# Set once the progress files have been checked in this process
+_INIT_DONE = False
+
+# Progress CSV columns, in file order
+_FIELDNAMES = [
+    'user_id', 'timestamp', 'day', 'weight', 'height',
+    'workout_completed', 'duration_min', 'calories_burned',
+    'waist', 'chest', 'bmi', 'whtr'
+]
+
+# Progress CSV columns holding numbers
+_NUMERIC_FIELDS = (
+    'day', 'weight', 'height', 'duration_min', 'calories_burned', 'waist', 'chest', 'bmi', 'whtr'
+)
+
+# Summary line for each progress record, rendered once when it is loaded
+_PROGRESS_LINE = (
+    "Day {day} | {timestamp} | Weight: {weight}kg | "
+    "Duration: {duration_min}min | Calories: {calories_burned}"
+)
+
+
+def _to_number(value: Optional[str]) -> Optional[float]:
+    """Parse a CSV cell as int or float; blank or invalid cells become None."""
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+
+
+def _to_bool(value: Optional[str]) -> Optional[bool]:
+    """Parse a CSV cell written from a bool; blank cells become None."""
+    if not value:
+        return None
+    return value.strip().lower() == 'true'
 
 class ProgressAgent(BaseAgent):
+    # Logged days per user, shared by all instances, valid while the CSV's stat matches
+    _days_by_user: Dict[str, Set[int]] = {}
+    _days_mtime: Optional[Tuple[int, int]] = None
+
+    # Parsed records per user, covering the CSV up to _records_offset bytes; only
+    # bytes appended after that are read on the next load
+    _records_by_user: Dict[str, List[Dict[str, Any]]] = {}
+    _records_fields: List[str] = _FIELDNAMES
+    _records_offset = 0
+    _records_inode: Optional[int] = None
+    _records_lock = threading.Lock()
+
     def __init__(self):
         super().__init__()
-        self.llm = Ollama(model=os.getenv("OLLAMA_MODEL", "llama3.2"))
         self.data_file = 'data/progress_data.csv'
         self.profile_file = 'data/user_profiles.json'
-        self._init_files()
+        global _INIT_DONE
+        if not _INIT_DONE:
+            self._init_files()
+            _INIT_DONE = True
+
+    @property
+    def llm(self):
+        """Shared LLM client, created on first use rather than with the agent."""
+        return get_llm()
 
     def _init_files(self):
         """Initialize files with proper permissions"""
-        os.makedirs('data', exist_ok=True)
-
         # Initialize CSV with essential fields
-        if not os.path.exists(self.data_file):
-            with open(self.data_file, 'w', newline='') as f:
+        try:
+            with open(self.data_file, 'x', newline='') as f:
                 writer = csv.writer(f)
-                writer.writerow([
-                    'user_id', 'timestamp', 'day', 'weight', 'height',
-                    'workout_completed', 'duration_min', 'calories_burned',
-                    'waist', 'chest'
-                ])
+                writer.writerow(_FIELDNAMES)
+        except FileExistsError:
+            self._upgrade_columns()
 
         # Initialize JSON file if not exists
-        if not os.path.exists(self.profile_file):
-            with open(self.profile_file, 'w') as f:
-                json.dump({}, f)
+        create_file_if_missing(self.profile_file, b'{}')
+
+    def _upgrade_columns(self):
+        """Rewrite a progress CSV written before the derived metric columns existed."""
+        with open(self.data_file, newline='') as f:
+            reader = csv.DictReader(f)
+            if reader.fieldnames is None or reader.fieldnames == _FIELDNAMES:
+                return
+            rows = list(reader)
+
+        tmp_path = f"{self.data_file}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=_FIELDNAMES, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(rows)
+        os.replace(tmp_path, self.data_file)
 
     def get_form(self) -> Dict[str, Any]:
         """Progress input form structure"""
@@ -66,17 +134,16 @@ class ProgressAgent(BaseAgent):
                 'duration_min': data.get('duration_min'),
                 'calories_burned': data.get('calories_burned'),
                 'waist': data.get('body_measurements', {}).get('waist'),
-                'chest': data.get('body_measurements', {}).get('chest')
+                'chest': data.get('body_measurements', {}).get('chest'),
+                'bmi': data.get('metrics', {}).get('bmi'),
+                'whtr': data.get('metrics', {}).get('whtr')
             }
 
             # Write to CSV with separate columns for each metric
             with open(self.data_file, 'a', newline='') as f:
-                writer = csv.DictWriter(f, fieldnames=[
-                    'user_id', 'timestamp', 'day', 'weight', 'height',
-                    'workout_completed', 'duration_min', 'calories_burned',
-                    'waist', 'chest'
-                ])
+                writer = csv.DictWriter(f, fieldnames=_FIELDNAMES)
                 writer.writerow(entry)
+            self._record_day(user_id, entry['day'])
 
             # Update profile
             self._update_profile(user_id, entry)
@@ -84,19 +151,42 @@ class ProgressAgent(BaseAgent):
         except Exception as e:
             return {'status': 'error', 'message': str(e)}
 
+    def _file_signature(self) -> Tuple[int, int]:
+        """Modification time and size identifying the current progress file contents."""
+        st = os.stat(self.data_file)
+        return st.st_mtime_ns, st.st_size
+
+    def _user_days(self, user_id: str) -> Set[int]:
+        """Days already logged by a user, re-reading the CSV only when it changed."""
+        signature = self._file_signature()
+        if ProgressAgent._days_mtime != signature:
+            days_by_user: Dict[str, Set[int]] = {}
+            with open(self.data_file, newline='') as f:
+                for row in csv.DictReader(f):
+                    try:
+                        day = int(float(row['day']))
+                    except (TypeError, ValueError):
+                        continue
+                    days_by_user.setdefault(row['user_id'], set()).add(day)
+            ProgressAgent._days_by_user = days_by_user
+            ProgressAgent._days_mtime = signature
+        return ProgressAgent._days_by_user.get(user_id, set())
+
+    def _record_day(self, user_id: str, day: int) -> None:
+        """Add a just-logged day to the cache so the next lookup skips the re-read."""
+        try:
+            ProgressAgent._days_by_user.setdefault(user_id, set()).add(day)
+            ProgressAgent._days_mtime = self._file_signature()
+        except OSError:
+            ProgressAgent._days_mtime = None
+
     def _next_day(self, user_id: str) -> int:
         """Get next day in 7-day cycle"""
         try:
             if not os.path.exists(self.data_file):
                 return 1
 
-            df = pd.read_csv(self.data_file)
-            user_data = df[df['user_id'] == user_id]
-
-            if user_data.empty:
-                return 1
-
-            days = user_data['day'].dropna().astype(int).unique()
+            days = self._user_days(user_id)
             return next((d for d in range(1, 8) if d not in days), 1)
         except:
             return 1
@@ -104,15 +194,8 @@ class ProgressAgent(BaseAgent):
     def _update_profile(self, user_id: str, entry: Dict[str, Any]):
         """Update user profile with progress"""
         try:
-            profiles = {}
-            if os.path.exists(self.profile_file):
-                with open(self.profile_file, 'r') as f:
-                    profiles = json.load(f)
-
-            if user_id not in profiles:
-                profiles[user_id] = {'progress': []}
-
-            profiles[user_id]['progress'].append({
+            # Appended to the user's progress log; folded into the profile file on its next write
+            append_progress_entry(user_id, {
                 'timestamp': entry['timestamp'],
                 'day': entry['day'],
                 'data': {
@@ -122,35 +205,62 @@ class ProgressAgent(BaseAgent):
                     'duration_min': entry.get('duration_min'),
                     'calories_burned': entry.get('calories_burned'),
                     'waist': entry.get('waist'),
-                    'chest': entry.get('chest')
+                    'chest': entry.get('chest'),
+                    'bmi': entry.get('bmi'),
+                    'whtr': entry.get('whtr')
                 }
             })
-
-            with open(self.profile_file, 'w') as f:
-                json.dump(profiles, f, indent=2)
         except:
             pass
 
+    @staticmethod
+    def _parse_record(record: Dict[str, Any]) -> Dict[str, Any]:
+        """Cast a CSV row's fields and add the derived display fields."""
+        for field in _NUMERIC_FIELDS:
+            record[field] = _to_number(record.get(field))
+        record['workout_completed'] = _to_bool(record.get('workout_completed'))
+        # Add body_measurements field for backward compatibility
+        record['body_measurements'] = {
+            'waist': record.get('waist'),
+            'chest': record.get('chest')
+        }
+        record['_line'] = _PROGRESS_LINE.format_map(record)
+        return record
+
+    def _read_appended(self) -> None:
+        """Parse the complete lines written after _records_offset into the per-user cache."""
+        with open(self.data_file, 'rb') as f:
+            f.seek(ProgressAgent._records_offset)
+            chunk = f.read()
+        # A line still being written is left for the next read
+        end = chunk.rfind(b'\n') + 1
+        if not end:
+            return
+
+        lines = chunk[:end].decode('utf-8').splitlines()
+        if ProgressAgent._records_offset == 0:
+            ProgressAgent._records_fields = next(csv.reader(lines[:1]), _FIELDNAMES)
+            lines = lines[1:]
+        for row in csv.DictReader(lines, fieldnames=ProgressAgent._records_fields):
+            ProgressAgent._records_by_user.setdefault(row['user_id'], []).append(self._parse_record(row))
+        ProgressAgent._records_offset += end
+
     def load_progress(self, user_id: str) -> List[Dict[str, Any]]:
         """Load user progress data"""
         try:
             if not os.path.exists(self.data_file):
                 return []
 
-            df = pd.read_csv(self.data_file)
-            user_data = df[df['user_id'] == user_id]
-
-            # Convert to list of dicts
-            records = user_data.to_dict('records')
-
-            # Add body_measurements field for backward compatibility
-            for record in records:
-                record['body_measurements'] = {
-                    'waist': record.get('waist'),
-                    'chest': record.get('chest')
-                }
-
-            return records
+            st = os.stat(self.data_file)
+            with ProgressAgent._records_lock:
+                # The file is append-only; a replaced or truncated file is parsed again
+                if st.st_ino != ProgressAgent._records_inode or st.st_size < ProgressAgent._records_offset:
+                    ProgressAgent._records_by_user = {}
+                    ProgressAgent._records_offset = 0
+                    ProgressAgent._records_inode = st.st_ino
+                if st.st_size > ProgressAgent._records_offset:
+                    self._read_appended()
+                return list(ProgressAgent._records_by_user.get(user_id, ()))
         except Exception as e:
             print(f"Error loading progress: {e}")
             return []
@@ -176,7 +286,9 @@ class ProgressAgent(BaseAgent):
                     'duration_min': last_entry.get('duration_min') if last_entry else None,
                     'calories_burned': last_entry.get('calories_burned') if last_entry else None,
                     'waist': last_entry.get('waist') if last_entry else None,
-                    'chest': last_entry.get('chest') if last_entry else None
+                    'chest': last_entry.get('chest') if last_entry else None,
+                    'bmi': last_entry.get('bmi') if last_entry else None,
+                    'whtr': last_entry.get('whtr') if last_entry else None
                 },
                 'recent_progress': progress[-5:] if len(progress) > 0 else [],
                 'trends': trends,
@@ -188,36 +300,36 @@ class ProgressAgent(BaseAgent):
 
     def _analyze_trends(self, data: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Calculate fitness trends"""
-        df = pd.DataFrame(data)
+        # Imported here so that loading progress does not pay for the NumPy import
+        import numpy as np
+
         trends = {}
+        if not data:
+            return trends
 
-        # Weight trend
-        if 'weight' in df.columns and not df['weight'].isna().all():
-            weights = df.dropna(subset=['weight'])
-            if len(weights) >= 2:
-                start, end = weights.iloc[0]['weight'], weights.iloc[-1]['weight']
-                change = end - start
-                trends['weight'] = {
-                    'start': start, 'end': end,
-                    'change_kg': round(change, 2),
-                    'change_percent': round((change/start)*100, 2) if start else 0
+        # Weight and body measurement trends, computed for all columns at once;
+        # missing values become NaN and are skipped when finding the first and last value
+        measures = ('weight', 'waist', 'chest')
+        values = np.array([[record.get(m) for m in measures] for record in data], dtype=float)
+        present = ~np.isnan(values)
+        counts = present.sum(axis=0)
+        columns = np.arange(len(measures))
+        starts = values[present.argmax(axis=0), columns]
+        ends = values[len(values) - 1 - present[::-1].argmax(axis=0), columns]
+        changes = np.round(ends - starts, 2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            percents = np.round(np.where(starts != 0, (ends - starts) / starts * 100, 0), 2)
+        for i, measure in enumerate(measures):
+            if counts[i] >= 2:
+                trends[measure] = {
+                    'start': starts[i], 'end': ends[i],
+                    'change_kg' if measure == 'weight' else 'change': changes[i],
+                    'change_percent': percents[i]
                 }
 
-        # Body measurement trends
-        for measure in ['waist', 'chest']:
-            if measure in df.columns and not df[measure].isna().all():
-                measurements = df.dropna(subset=[measure])
-                if len(measurements) >= 2:
-                    start, end = measurements.iloc[0][measure], measurements.iloc[-1][measure]
-                    change = end - start
-                    trends[measure] = {
-                        'start': start, 'end': end,
-                        'change': round(change, 2),
-                        'change_percent': round((change/start)*100, 2) if start else 0
-                    }
-
         # Completion rate
-        if 'workout_completed' in df.columns:
-            trends['completion_rate'] = round(df['workout_completed'].mean() * 100)
+        completed = np.array([record.get('workout_completed') for record in data], dtype=float)
+        if not np.isnan(completed).all():
+            trends['completion_rate'] = round(np.nanmean(completed) * 100)
 
-        return trends
+        return trends
\ No newline at end of file
@@ -1,50 +1,123 @@
-import os
 import csv
-from typing import Dict, Any, List, Optional
-from langchain_community.llms import Ollama
-from langchain.prompts import PromptTemplate
+import asyncio
+import functools
+import threading
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Dict, Any, FrozenSet, Iterator, List, Mapping, Optional, Tuple, TYPE_CHECKING
 from agents.base_agent import BaseAgent
+from agents.llm import get_llm
+
+if TYPE_CHECKING:
+    from langchain.prompts import PromptTemplate
+
+# Start of the text returned in place of a plan when the LLM call fails
+PLAN_FAILED = "Failed to generate workout plan"
+
+# How each exercise is listed in the prompt
+_EXERCISE_LINE = (
+    "- {ExerciseName}: Targets {BodyPart}, Equipment: {Equipment}, "
+    "Difficulty: {Difficulty}, Injury Risk: {InjuryRisk}"
+)
 
 class WorkoutAgent(BaseAgent):
+    # Read-only exercise rows shared by all instances, loaded on first use
+    _WORKOUTS: Optional[Tuple[Mapping[str, str], ...]] = None
+    # Row indices bucketed by lower-cased column value, built alongside _WORKOUTS
+    _by_difficulty: Dict[str, FrozenSet[int]] = {}
+    _by_injury_risk: Dict[str, FrozenSet[int]] = {}
+    _by_name: Dict[str, FrozenSet[int]] = {}
+    _by_equipment: Dict[str, FrozenSet[int]] = {}
+    # Rows each fitness level may use, and all rows for any other level
+    _level_allowed: Dict[str, FrozenSet[int]] = {}
+    _all_rows: FrozenSet[int] = frozenset()
+    # Prompt line for each row, rendered once at load time
+    _rendered: Tuple[str, ...] = ()
+    # Generated plans keyed by the exact prompt, least recently used first
+    _plan_cache: "OrderedDict[str, str]" = OrderedDict()
+    _plan_cache_size = 256
+    _plan_lock = threading.Lock()
+
     def __init__(self):
-        model = os.getenv("OLLAMA_MODEL", "llama3.2")
-        self.llm = Ollama(model=model)
         self.workout_data = self._load_workout_data()
-        self.prompt = PromptTemplate(
-            input_variables=["goal", "level", "preferences","filtered_exercises"],
-            template=(
-                "You are a professional fitness coach.\n"
-                "Generate a **structured 7-day workout plan** for the user as detailed readable text.\n"
-                "Here is a list of exercises you should use:\n"
-                "{filtered_exercises}\n\n"
-                "Take into account the following conflict resolutions:\n"
-                "{conflict_resolutions}\n"
-                "And the following dynamic rules:\n"
-                "{dynamic_rules}\n\n"
-                "Include:\n"
-                "- Time of day recommendation (morning/evening)\n"
-                "- Warm-up exercises\n"
-                "- Main exercises with sets, reps, rest, and tips\n"
-                "- Cooldown / stretching\n"
-                "- Daily suggestions and tips\n"
-                "- Progression advice for next week\n\n"
-                "User Goal: {goal}\n"
-                "Fitness Level: {level}\n"
-                "Preferences: {preferences}\n\n"
-                "Return ONLY human-readable text. Do NOT use JSON."
-            )
+        # Raw template string, formatted directly to skip PromptTemplate validation per call
+        self._prompt_str = (
+            "You are a professional fitness coach.\n"
+            "Generate a **structured 7-day workout plan** for the user as detailed readable text.\n"
+            "Here is a list of exercises you should use:\n"
+            "{filtered_exercises}\n\n"
+            "Take into account the following conflict resolutions:\n"
+            "{conflict_resolutions}\n"
+            "And the following dynamic rules:\n"
+            "{dynamic_rules}\n\n"
+            "Include:\n"
+            "- Time of day recommendation (morning/evening)\n"
+            "- Warm-up exercises\n"
+            "- Main exercises with sets, reps, rest, and tips\n"
+            "- Cooldown / stretching\n"
+            "- Daily suggestions and tips\n"
+            "- Progression advice for next week\n\n"
+            "User Goal: {goal}\n"
+            "Fitness Level: {level}\n"
+            "Preferences: {preferences}\n\n"
+            "Return ONLY human-readable text. Do NOT use JSON."
         )
 
-    def _load_workout_data(self) -> List[Dict[str, Any]]:
-        """Load workout data from CSV file."""
-        workout_data = []
-        try:
-            with open('data/workouts.csv', mode='r') as file:
-                reader = csv.DictReader(file)
-                workout_data = [row for row in reader]
-        except FileNotFoundError:
-            print("Workout data file not found. Using default workout data.")
-        return workout_data
+    @property
+    def prompt(self) -> "PromptTemplate":
+        """The plan prompt as a LangChain PromptTemplate, built on access."""
+        from langchain.prompts import PromptTemplate
+
+        return PromptTemplate(
+            input_variables=[
+                "goal", "level", "preferences", "filtered_exercises",
+                "conflict_resolutions", "dynamic_rules"
+            ],
+            template=self._prompt_str
+        )
+
+    @property
+    def llm(self):
+        """Shared LLM client, created on first use rather than with the agent."""
+        return get_llm()
+
+    @classmethod
+    def _load_workout_data(cls) -> Tuple[Mapping[str, str], ...]:
+        """Load workout data from CSV file once; rows are read-only so they can be shared."""
+        if cls._WORKOUTS is None:
+            try:
+                with open('data/workouts.csv', mode='r') as file:
+                    reader = csv.DictReader(file)
+                    workouts = tuple(MappingProxyType(row) for row in reader)
+            except FileNotFoundError:
+                print("Workout data file not found. Using default workout data.")
+                return ()
+            cls._by_difficulty = cls._index_by(workouts, "Difficulty")
+            cls._by_injury_risk = cls._index_by(workouts, "InjuryRisk")
+            cls._by_name = cls._index_by(workouts, "ExerciseName")
+            cls._by_equipment = cls._index_by(workouts, "Equipment")
+            cls._all_rows = frozenset(range(len(workouts)))
+            cls._level_allowed = {
+                "beginner": cls._rows_where(cls._by_difficulty, "beginner"),
+                "intermediate": cls._all_rows - cls._rows_where(cls._by_difficulty, "advanced"),
+                "advanced": cls._rows_where(cls._by_difficulty, "advanced", "intermediate"),
+            }
+            cls._rendered = tuple(_EXERCISE_LINE.format_map(row) for row in workouts)
+            cls._WORKOUTS = workouts
+        return cls._WORKOUTS
+
+    @staticmethod
+    def _index_by(rows: Tuple[Mapping[str, str], ...], column: str) -> Dict[str, FrozenSet[int]]:
+        """Bucket row indices by the lower-cased value of a column."""
+        buckets: Dict[str, set] = {}
+        for i, row in enumerate(rows):
+            buckets.setdefault((row.get(column) or "").lower(), set()).add(i)
+        return {value: frozenset(indices) for value, indices in buckets.items()}
+
+    @classmethod
+    def _rows_where(cls, index: Dict[str, FrozenSet[int]], *values: str) -> FrozenSet[int]:
+        """Indices of the rows whose indexed column has any of the given values."""
+        return frozenset().union(*(index.get(value, frozenset()) for value in values))
 
     def _filter_exercises(
         self,
@@ -55,55 +128,90 @@ class WorkoutAgent(BaseAgent):
         """
         Filter exercises based on user profile, conflict resolutions, and dynamic rules.
         """
-        filtered_exercises = []
         preferences = user_profile.get("preferences", "").lower()
-        level = user_profile.get("level", "Beginner").lower()
-
-        for exercise in self.workout_data:
-            # Filter by fitness level
-            if level == "beginner" and exercise.get("Difficulty", "").lower() != "beginner":
-                continue
-            elif level == "intermediate" and exercise.get("Difficulty", "").lower() == "advanced":
-                continue
-            elif level == "advanced" and exercise.get("Difficulty", "").lower() not in ["advanced", "intermediate"]:
-                continue
-            # Filter by injury risk
-            if "injury" in preferences and exercise.get("InjuryRisk", "").lower() == "high":
-                continue
-            # Filter by user preferences
-            if "no running" in preferences and exercise.get("ExerciseName", "").lower() == "running":
-                continue
-            filtered_exercises.append(exercise)
+        adjustments = tuple(
+            resolution.get("adjustment") for resolution in conflict_resolutions or []
+        )
+        # Only these parts of the inputs affect the result, so they form the cache key
+        return self._filter_exercises_cached(
+            user_profile.get("level", "Beginner").lower(),
+            "injury" in preferences,
+            "no running" in preferences,
+            adjustments
+        )
+
+    @classmethod
+    @functools.lru_cache(maxsize=256)
+    def _filter_exercises_cached(
+        cls,
+        level: str,
+        avoid_injury: bool,
+        no_running: bool,
+        adjustments: Tuple[Optional[str], ...]
+    ) -> str:
+        """Filter and format exercises for hashable filter inputs."""
+        cls._load_workout_data()
+
+        # Filter by fitness level, starting from the level's precomputed rows
+        selected = cls._level_allowed.get(level, cls._all_rows)
+        # Filter by injury risk
+        if avoid_injury:
+            selected -= cls._rows_where(cls._by_injury_risk, "high")
+        # Filter by user preferences
+        if no_running:
+            selected -= cls._rows_where(cls._by_name, "running")
 
         # Apply conflict resolutions
-        if conflict_resolutions:
-            for resolution in conflict_resolutions:
-                if resolution.get("adjustment") == "Decrease intensity and suggest low-impact exercises":
-                    filtered_exercises = [
-                        ex for ex in filtered_exercises
-                        if ex.get("InjuryRisk", "").lower() in ["low", "medium"]
-                    ]
-                elif resolution.get("adjustment") == "Suggest low-intensity exercises":
-                    filtered_exercises = [
-                        ex for ex in filtered_exercises
-                        if ex.get("Difficulty", "").lower() in ["beginner"]
-                    ]
-                elif resolution.get("adjustment") == "Suggest indoor workouts":
-                    filtered_exercises = [
-                        ex for ex in filtered_exercises
-                        if ex.get("Equipment", "").lower() != "none" or
-                           ex.get("ExerciseName", "").lower() in ["yoga", "push-ups", "squats"]
-                    ]
-
-        # Format for prompt
-        exercises_str = "\n".join(
-            f"- {exercise['ExerciseName']}: Targets {exercise['BodyPart']}, "
-            f"Equipment: {exercise['Equipment']}, "
-            f"Difficulty: {exercise['Difficulty']}, "
-            f"Injury Risk: {exercise['InjuryRisk']}"
-            for exercise in filtered_exercises
+        for adjustment in adjustments:
+            if adjustment == "Decrease intensity and suggest low-impact exercises":
+                selected &= cls._rows_where(cls._by_injury_risk, "low", "medium")
+            elif adjustment == "Suggest low-intensity exercises":
+                selected &= cls._rows_where(cls._by_difficulty, "beginner")
+            elif adjustment == "Suggest indoor workouts":
+                selected -= cls._rows_where(cls._by_equipment, "none") - cls._rows_where(
+                    cls._by_name, "yoga", "push-ups", "squats"
+                )
+
+        # Format for prompt from the pre-rendered lines
+        rendered = cls._rendered
+        return "\n".join(rendered[i] for i in sorted(selected))
+
+    def _format_prompt(
+        self,
+        user_profile: Dict[str, Any],
+        conflict_resolutions: Optional[List[Dict[str, Any]]] = None,
+        dynamic_rules: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """Build the workout plan prompt for a user."""
+        preferences = user_profile.get("preferences", "none")
+        filtered_exercises = self._filter_exercises(
+            user_profile, conflict_resolutions, dynamic_rules
         )
-        return exercises_str
+        return self._prompt_str.format_map({
+            "goal": user_profile.get("goal", "general fitness"),
+            "level": user_profile.get("level", "Beginner"),
+            "preferences": preferences,
+            "filtered_exercises": filtered_exercises,
+            "conflict_resolutions": str(conflict_resolutions),
+            "dynamic_rules": str(dynamic_rules)
+        })
+
+    @classmethod
+    def _cached_plan(cls, formatted_prompt: str) -> Optional[str]:
+        """Previously generated plan for this exact prompt, if any."""
+        with cls._plan_lock:
+            cached = cls._plan_cache.get(formatted_prompt)
+            if cached is not None:
+                cls._plan_cache.move_to_end(formatted_prompt)
+            return cached
+
+    @classmethod
+    def _store_plan(cls, formatted_prompt: str, plan: str) -> None:
+        """Remember a generated plan, evicting the least recently used one when full."""
+        with cls._plan_lock:
+            cls._plan_cache[formatted_prompt] = plan
+            if len(cls._plan_cache) > cls._plan_cache_size:
+                cls._plan_cache.popitem(last=False)
 
     def generate_plan(
         self,
@@ -114,20 +222,63 @@ class WorkoutAgent(BaseAgent):
         """
         Generate a full detailed 7-day workout plan as readable text.
         """
-        preferences = user_profile.get("preferences", "none")
-        filtered_exercises = self._filter_exercises(
-            user_profile, conflict_resolutions, dynamic_rules
-        )
-        formatted_prompt = self.prompt.format(
-            goal=user_profile.get("goal", "general fitness"),
-            level=user_profile.get("level", "Beginner"),
-            preferences=preferences,
-            filtered_exercises=filtered_exercises,
-            conflict_resolutions=str(conflict_resolutions),
-            dynamic_rules=str(dynamic_rules)
-        )
+        formatted_prompt = self._format_prompt(user_profile, conflict_resolutions, dynamic_rules)
+        cached = self._cached_plan(formatted_prompt)
+        if cached is not None:
+            return cached
         try:
             response = self.llm.invoke(formatted_prompt)
-            return response.strip()
         except Exception as e:
-            return f"Failed to generate workout plan: {e}"
\ No newline at end of file
+            return f"{PLAN_FAILED}: {e}"
+        plan = response.strip()
+        self._store_plan(formatted_prompt, plan)
+        return plan
+
+    def stream_plan(
+        self,
+        user_profile: Dict[str, Any],
+        conflict_resolutions: Optional[List[Dict[str, Any]]] = None,
+        dynamic_rules: Optional[Dict[str, Any]] = None
+    ) -> Iterator[str]:
+        """
+        Generate the same plan as generate_plan, yielding text chunks as the LLM produces them.
+        """
+        formatted_prompt = self._format_prompt(user_profile, conflict_resolutions, dynamic_rules)
+        cached = self._cached_plan(formatted_prompt)
+        if cached is not None:
+            yield cached
+            return
+        chunks = []
+        try:
+            for chunk in self.llm.stream(formatted_prompt):
+                # Leading whitespace is dropped, as generate_plan strips it
+                if not chunks:
+                    chunk = chunk.lstrip()
+                    if not chunk:
+                        continue
+                chunks.append(chunk)
+                yield chunk
+        except Exception as e:
+            yield f"{PLAN_FAILED}: {e}"
+            return
+        self._store_plan(formatted_prompt, "".join(chunks).strip())
+
+    @classmethod
+    def clear_cache(cls) -> None:
+        """Forget memoized exercise filters and generated plans."""
+        cls._filter_exercises_cached.cache_clear()
+        with cls._plan_lock:
+            cls._plan_cache.clear()
+
+    async def agenerate_plan(
+        self,
+        user_profile: Dict[str, Any],
+        conflict_resolutions: Optional[List[Dict[str, Any]]] = None,
+        dynamic_rules: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """
+        Async variant of generate_plan; the blocking LLM call runs in a worker thread.
+        """
+        return await asyncio.to_thread(
+            self.generate_plan, user_profile, conflict_resolutions, dynamic_rules
+        )
\ No newline at end of file
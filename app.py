@@ -1,14 +1,170 @@
 import sys
 import os
+import time
 import streamlit as st
+from streamlit.errors import StreamlitAPIException
 import json
 from dotenv import load_dotenv
-from agents.orchestrator import Orchestrator
+from agents.profile_agent import ProfileAgent
+from agents.progress_agent import ProgressAgent
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 # Load environment variables
 load_dotenv()
-orchestrator = Orchestrator()
+
+
+@st.cache_resource
+def _profile_agent() -> ProfileAgent:
+    """Profile store shared by all sessions; it does not load any LLM client."""
+    return ProfileAgent()
+
+
+@st.cache_resource
+def _progress_agent() -> ProgressAgent:
+    """Progress store shared by all sessions; it does not load any LLM client."""
+    return ProgressAgent()
+
+
+def _get_orchestrator():
+    """This session's orchestrator, importing and creating it on first use."""
+    # Imported here so that pages which only read profiles and progress skip the LLM stack
+    from agents.orchestrator import Orchestrator
+
+    if "orchestrator" not in st.session_state:
+        st.session_state.orchestrator = Orchestrator()
+    return st.session_state.orchestrator
+
+
+PROFILES_PATH = os.path.join("data", "user_profiles.json")
+PROGRESS_PATH = os.path.join("data", "progress_data.csv")
+
+
+def _file_signature(path: str) -> tuple:
+    """Modification time and size identifying a file's current contents; (0, 0) if it is missing."""
+    try:
+        st_result = os.stat(path)
+    except FileNotFoundError:
+        return 0, 0
+    return st_result.st_mtime_ns, st_result.st_size
+
+
+# Only the current file contents are ever looked up again, so older entries can go
+@st.cache_data(show_spinner=False, max_entries=2)
+def _load_profiles(signature: tuple) -> dict:
+    """Profiles as of the given file signature; a new signature loads them again."""
+    return _profile_agent().load_user_profile()
+
+
+def load_profiles() -> dict:
+    """All user profiles, re-read only when the profiles file has changed."""
+    return _load_profiles(_file_signature(PROFILES_PATH))
+
+
+# Summaries for the users viewed recently; entries for older file contents age out
+@st.cache_data(show_spinner=False, max_entries=16)
+def _cached_summary(user_name: str, signature: tuple) -> dict:
+    """A user's progress summary as of the given progress file signature."""
+    return _progress_agent().get_summary(user_name)
+
+
+def progress_summary(user_name: str) -> dict:
+    """Progress summary for a user, recomputed only when the progress file has changed."""
+    return _cached_summary(user_name, _file_signature(PROGRESS_PATH))
+
+
+# Seconds a generated plan is reused for the same profile
+PLAN_TTL_SECONDS = 3600
+# Seconds between checks on a feedback run in the background
+FEEDBACK_POLL_SECONDS = 0.5
+# Starting values of the progress form, kept per session under these widget keys
+PROGRESS_FORM_DEFAULTS = {
+    "progress_weight": 70.0,
+    "progress_height": 170.0,
+    "progress_workout_completed": True,
+    "progress_duration_min": 30,
+    "progress_calories_burned": 200,
+    "progress_waist": 80.0,
+    "progress_chest": 90.0,
+}
+
+
+@st.cache_resource
+def _background_executor() -> ThreadPoolExecutor:
+    """Threads running orchestrator work off the script thread, shared by all sessions."""
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="app-run")
+
+
+def _rerun_fragment() -> None:
+    """Rerun only the calling fragment; during a full app run, rerun the app instead."""
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        # Fragment-scoped reruns are only allowed while the fragment reruns on its own
+        st.rerun()
+
+
+def _cached_plans(profile_key: str):
+    """This session's plans for a profile given as canonical JSON, if still fresh."""
+    cached = st.session_state.setdefault("generated_plans", {}).get(profile_key)
+    if cached and time.time() - cached[0] < PLAN_TTL_SECONDS:
+        return cached[1]
+    return None
+
+
+def _table_cell(value) -> str:
+    """Text for one Markdown table cell, with pipes escaped and line breaks flattened."""
+    return " ".join(str(value).split()).replace("|", "\\|")
+
+
+def _meal_plan_table(meal_plan: list) -> str:
+    """Meal plan as one Markdown table, so it renders as a single element."""
+    lines = [
+        "| Meal | Description | kcal | Protein (g) | Carbs (g) | Fat (g) |",
+        "|---|---|---|---|---|---|",
+    ]
+    for meal in meal_plan:
+        cells = (
+            meal.get('type', ''), meal.get('description', ''), meal.get('calories', 'N/A'),
+            meal.get('protein', 'N/A'), meal.get('carbs', 'N/A'), meal.get('fat', 'N/A'),
+        )
+        lines.append("| " + " | ".join(_table_cell(cell) for cell in cells) + " |")
+    return "\n".join(lines)
+
+
+def render_nutrition(result: dict) -> None:
+    """Nutrition plan from an orchestrator result, as a table when it parsed as JSON."""
+    if result["nutrition_json"] and "meal_plan" in result["nutrition_json"]:
+        st.markdown(_meal_plan_table(result["nutrition_json"]["meal_plan"]))
+    else:
+        st.text(result["nutrition_text"])
+
+
+def _stream_plans(profile_data: dict, profile_key: str) -> dict:
+    """Generate plans, writing the workout plan to the page as it streams in."""
+    result = {}
+
+    orchestrator = _get_orchestrator()
+
+    def workout_chunks():
+        for section, payload in orchestrator.run_stream(profile_data):
+            if section == "workout":
+                yield payload
+            else:
+                result.update(payload)
+
+    st.write_stream(workout_chunks())
+
+    # Failed plans are not kept, so the next click tries again
+    from agents.workout_agent import PLAN_FAILED
+
+    if PLAN_FAILED not in result["workout_text"]:
+        plans = st.session_state.generated_plans
+        now = time.time()
+        for key in [k for k, (created, _) in plans.items() if now - created >= PLAN_TTL_SECONDS]:
+            del plans[key]
+        plans[profile_key] = (now, result)
+    return result
 
 # App title
 st.title("AI Multi-Agent Fitness Coach")
@@ -16,11 +172,12 @@ st.title("AI Multi-Agent Fitness Coach")
 # Initialize data directory and files
 os.makedirs("data", exist_ok=True)
 
+# Load all profiles once per run; the sidebar and the main page share them
+profiles_data = load_profiles()
+
 # ---------------- Sidebar: Profile Management ----------------
 with st.sidebar:
     st.header("User Profile")
-    # Load all profiles
-    profiles_data = orchestrator.profile_agent.load_user_profile()
     usernames = list(profiles_data.keys())
 
     # Initialize session state for selected_user if it doesn't exist
@@ -59,7 +216,7 @@ with st.sidebar:
                     "health_info": health_info,
                     "meal_preference": meal_preference
                 }
-                orchestrator.profile_agent.update_profile({name: profile_data})
+                _profile_agent().update_profile({name: profile_data})
                 st.success(f"Profile '{name}' saved!")
                 st.session_state.selected_user = name  # Update selection
                 st.rerun()  # Rerun to reflect the new user in the dropdown
@@ -81,207 +238,260 @@ with st.sidebar:
             """
         )
 
-# ---------------- Main Page: Workflow ----------------
-if "selected_user" in st.session_state and st.session_state.selected_user != "New User":
-    # Reload profiles_data to ensure it's up-to-date
-    profiles_data = orchestrator.profile_agent.load_user_profile()
-    if st.session_state.selected_user in profiles_data:
-        profile_data = profiles_data[st.session_state.selected_user]
-        st.subheader(f"Welcome, {profile_data['name']}!")
+# ---------------- Main Page Sections ----------------
+# Each section is a fragment, so its own widgets only rerun that section
 
-        # Add tabs for better organization
-        tab1, tab2, tab3 = st.tabs(["Generate Plans", "Log Progress", "View Progress"])
 
-        with tab1:
-            if st.button("Generate Plans"):
-                with st.spinner("Generating your personalized plans..."):
-                    result = orchestrator.run(profile_data)
-                    st.subheader("Workout Plan")
-                    st.text(result["workout_text"])
-
-                    st.subheader("Nutrition Plan")
-                    if result["nutrition_json"] and "meal_plan" in result["nutrition_json"]:
-                        for meal in result["nutrition_json"]["meal_plan"]:
-                            st.write(f"**{meal.get('type', '')}**: {meal.get('description', '')}")
-                            st.write(f"  → {meal.get('calories', 'N/A')} kcal | "
-                                    f"Protein: {meal.get('protein', 'N/A')}g | "
-                                    f"Carbs: {meal.get('carbs', 'N/A')}g | "
-                                    f"Fat: {meal.get('fat', 'N/A')}g")
-                            st.write("")  # Add space between meals
-                    else:
-                        st.text(result["nutrition_text"])
+@st.fragment
+def _plans_tab(profile_data: dict) -> None:
+    """Generate Plans tab."""
+    if st.button("Generate Plans"):
+        with st.spinner("Generating your personalized plans..."):
+            profile_key = json.dumps(profile_data, sort_keys=True)
+            st.subheader("Workout Plan")
+            result = _cached_plans(profile_key)
+            if result is None:
+                result = _stream_plans(profile_data, profile_key)
+            else:
+                st.markdown(result["workout_text"])
 
-        with tab2:
-            st.subheader("Log Your Daily Progress")
+            st.subheader("Nutrition Plan")
+            render_nutrition(result)
 
-            with st.form("progress_form"):
-                st.write("### Today's Progress")
 
-                # Basic metrics
-                weight = st.number_input(
-                    "Current Weight (kg)",
-                    value=70.0,
-                    step=0.1
-                )
+@st.fragment
+def _progress_tab(profile_data: dict) -> None:
+    """Log Progress tab."""
+    st.subheader("Log Your Daily Progress")
 
-                height = st.number_input(
-                    "Height (cm)",
-                    min_value=100.0,
-                    max_value=250.0,
-                    value=170.0,
-                    step=0.1
-                )
+    # Keep entered values across reruns until the form is submitted
+    for key, value in PROGRESS_FORM_DEFAULTS.items():
+        st.session_state.setdefault(key, value)
 
-                # Workout details
-                workout_completed = st.checkbox(
-                    "Completed Workout",
-                    value=True
-                )
+    with st.form("progress_form"):
+        st.write("### Today's Progress")
 
-                duration_min = st.number_input(
-                    "Workout Duration (minutes)",
-                    min_value=0,
-                    value=30
-                )
+        # Basic metrics
+        weight = st.number_input(
+            "Current Weight (kg)",
+            key="progress_weight",
+            step=0.1
+        )
 
-                calories_burned = st.number_input(
-                    "Calories Burned",
-                    min_value=0,
-                    value=200
-                )
+        height = st.number_input(
+            "Height (cm)",
+            min_value=100.0,
+            max_value=250.0,
+            key="progress_height",
+            step=0.1
+        )
 
-                # Body measurements
-                st.write("### Body Measurements (cm)")
-                waist = st.number_input(
-                    "Waist",
-                    min_value=50.0,
-                    max_value=150.0,
-                    value=80.0,
-                    step=0.1
-                )
+        # Workout details
+        workout_completed = st.checkbox(
+            "Completed Workout",
+            key="progress_workout_completed"
+        )
+
+        duration_min = st.number_input(
+            "Workout Duration (minutes)",
+            min_value=0,
+            key="progress_duration_min"
+        )
+
+        calories_burned = st.number_input(
+            "Calories Burned",
+            min_value=0,
+            key="progress_calories_burned"
+        )
+
+        # Body measurements
+        st.write("### Body Measurements (cm)")
+        waist = st.number_input(
+            "Waist",
+            min_value=50.0,
+            max_value=150.0,
+            key="progress_waist",
+            step=0.1
+        )
 
-                chest = st.number_input(
-                    "Chest",
-                    min_value=60.0,
-                    max_value=150.0,
-                    value=90.0,
-                    step=0.1
+        chest = st.number_input(
+            "Chest",
+            min_value=60.0,
+            max_value=150.0,
+            key="progress_chest",
+            step=0.1
+        )
+
+        if st.form_submit_button("Log Progress"):
+            # Derived metrics are computed once here and stored with the entry
+            height_m = height / 100
+            progress_data = {
+                'weight': weight,
+                'height': height,
+                'workout_completed': workout_completed,
+                'duration_min': duration_min,
+                'calories_burned': calories_burned,
+                'body_measurements': {
+                    'waist': waist,
+                    'chest': chest
+                },
+                'metrics': {
+                    'bmi': round(weight / height_m ** 2, 1),
+                    'whtr': round(waist / height, 2)
+                }
+            }
+
+            result = _progress_agent().log_progress(
+                profile_data["name"],
+                progress_data
+            )
+
+            if result['status'] == 'success':
+                st.success("Progress logged successfully!")
+                st.rerun()  # Refresh to show updated progress
+            else:
+                st.error(f"Error: {result['message']}")
+
+
+@st.fragment
+def _view_tab(profile_data: dict) -> None:
+    """View Progress tab."""
+    st.subheader("Your Progress Summary")
+
+    # Get progress summary
+    summary = progress_summary(profile_data["name"])
+
+    if 'error' in summary:
+        st.warning(summary['error'])
+    elif 'last_entry' in summary and summary['last_entry']:
+        last_entry = summary['last_entry']
+
+        st.write("### Last Workout Entry")
+        st.write(f"""
+        - **Date/Time:** {last_entry.get('timestamp', 'N/A')}
+        - **Weight:** {last_entry.get('weight', 'N/A')} kg
+        - **Height:** {last_entry.get('height', 'N/A')} cm
+        - **Duration:** {last_entry.get('duration_min', 'N/A')} minutes
+        - **Calories Burned:** {last_entry.get('calories_burned', 'N/A')}
+        """)
+
+        # Display body measurements if they exist
+        st.write("**Body Measurements:**")
+        waist_col, chest_col, bmi_col, whtr_col = st.columns(4)
+        waist_col.metric("Waist", f"{last_entry.get('waist', 'N/A')} cm")
+        chest_col.metric("Chest", f"{last_entry.get('chest', 'N/A')} cm")
+        if last_entry.get('bmi') is not None:
+            bmi_col.metric("BMI", last_entry['bmi'])
+        if last_entry.get('whtr') is not None:
+            whtr_col.metric("Waist-to-Height", last_entry['whtr'])
+
+        # Show trends if available
+        if 'trends' in summary:
+            st.write("### Your Progress Trends")
+
+            # Weight trend
+            if 'weight' in summary['trends']:
+                weight_trend = summary['trends']['weight']
+                st.metric(
+                    "Weight Change",
+                    f"{weight_trend['change_kg']} kg",
+                    f"{weight_trend['change_percent']}%"
                 )
 
-                if st.form_submit_button("Log Progress"):
-                    progress_data = {
-                        'weight': weight,
-                        'height': height,
-                        'workout_completed': workout_completed,
-                        'duration_min': duration_min,
-                        'calories_burned': calories_burned,
-                        'body_measurements': {
-                            'waist': waist,
-                            'chest': chest
-                        }
-                    }
-
-                    result = orchestrator.progress_agent.log_progress(
-                        profile_data["name"],
-                        progress_data
+            # Body measurement trends
+            for measure in ['waist', 'chest']:
+                if measure in summary['trends']:
+                    trend = summary['trends'][measure]
+                    st.metric(
+                        f"{measure.capitalize()} Change",
+                        f"{trend['change']} cm",
+                        f"{trend['change_percent']}%"
                     )
 
-                    if result['status'] == 'success':
-                        st.success("Progress logged successfully!")
-                        st.rerun()  # Refresh to show updated progress
-                    else:
-                        st.error(f"Error: {result['message']}")
+        # Show recent progress (simplified to just show time and duration)
+        st.write("### Recent Workouts")
+        if 'recent_progress' in summary and summary['recent_progress']:
+            st.dataframe(
+                [
+                    {"Date/Time": entry.get('timestamp'), "Duration (min)": entry.get('duration_min')}
+                    for entry in summary['recent_progress']
+                ],
+                hide_index=True
+            )
+        else:
+            st.write("No recent progress data available.")
+    else:
+        st.write("No progress data yet. Please log your first workout!")
+
+
+@st.fragment
+def _feedback_section(profile_data: dict) -> None:
+    """Feedback form and the plans updated from it."""
+    st.subheader("Feedback")
+    feedback_text = st.text_area("Your Feedback")
+    if st.button("Submit Feedback"):
+        if feedback_text.strip():
+            # Run in the background so the rest of the page stays usable meanwhile
+            future = _background_executor().submit(
+                _get_orchestrator().run, profile_data, feedback_text=feedback_text
+            )
+            st.session_state.feedback_job = (profile_data["name"], future)
+        else:
+            st.warning("Please enter feedback.")
+
+    job = st.session_state.get("feedback_job")
+    if job is None or job[0] != profile_data["name"]:
+        return
+    future = job[1]
+    if not future.done():
+        st.info("Updating your plans from feedback...")
+        time.sleep(FEEDBACK_POLL_SECONDS)
+        _rerun_fragment()
+    try:
+        result = future.result()
+    except Exception as e:
+        del st.session_state.feedback_job
+        st.error(f"Failed to process feedback: {e}")
+        return
+    # The finished job stays in session state so the plans can be opened on a later rerun
+    st.success("✅ Feedback stored and plans updated!")
+
+    # Show updated plans; their contents are rendered only while the expander is open
+    with st.expander("Updated Workout Plan", key="feedback_workout_plan", on_change="rerun") as workout_plan:
+        if workout_plan.open:
+            st.text(result["workout_text"])
+
+    with st.expander("Updated Nutrition Plan", key="feedback_nutrition_plan", on_change="rerun") as nutrition_plan:
+        if nutrition_plan.open:
+            render_nutrition(result)
+
+    if result["feedback_result"]:
+        st.info(f"Feedback Agent Response: {result['feedback_result'].get('suggested_action', 'Feedback recorded')}")
+    if result.get("conflict_resolution"):
+        st.info(f"Conflict Resolution: {result['conflict_resolution']}")
+    if result.get("dynamic_rules"):
+        st.info(f"Dynamic Rules Applied: {result['dynamic_rules']}")
+
+# ---------------- Main Page: Workflow ----------------
+if "selected_user" in st.session_state and st.session_state.selected_user != "New User":
+    if st.session_state.selected_user in profiles_data:
+        profile_data = profiles_data[st.session_state.selected_user]
+        st.subheader(f"Welcome, {profile_data['name']}!")
+
+        # Add tabs for better organization
+        tab1, tab2, tab3 = st.tabs(["Generate Plans", "Log Progress", "View Progress"])
+
+        with tab1:
+            _plans_tab(profile_data)
+
+        with tab2:
+            _progress_tab(profile_data)
 
         with tab3:
-            st.subheader("Your Progress Summary")
-
-            # Get progress summary
-            summary = orchestrator.progress_agent.get_summary(profile_data["name"])
-
-            if 'error' in summary:
-                st.warning(summary['error'])
-            elif 'last_entry' in summary and summary['last_entry']:
-                last_entry = summary['last_entry']
-
-                st.write("### Last Workout Entry")
-                st.write(f"""
-                - **Date/Time:** {last_entry.get('timestamp', 'N/A')}
-                - **Weight:** {last_entry.get('weight', 'N/A')} kg
-                - **Height:** {last_entry.get('height', 'N/A')} cm
-                - **Duration:** {last_entry.get('duration_min', 'N/A')} minutes
-                - **Calories Burned:** {last_entry.get('calories_burned', 'N/A')}
-                """)
-
-                # Display body measurements if they exist
-                st.write("**Body Measurements:**")
-                st.write(f"- Waist: {last_entry.get('waist', 'N/A')} cm")
-                st.write(f"- Chest: {last_entry.get('chest', 'N/A')} cm")
-
-                # Show trends if available
-                if 'trends' in summary:
-                    st.write("### Your Progress Trends")
-
-                    # Weight trend
-                    if 'weight' in summary['trends']:
-                        weight_trend = summary['trends']['weight']
-                        st.metric(
-                            "Weight Change",
-                            f"{weight_trend['change_kg']} kg",
-                            f"{weight_trend['change_percent']}%"
-                        )
-
-                    # Body measurement trends
-                    for measure in ['waist', 'chest']:
-                        if measure in summary['trends']:
-                            trend = summary['trends'][measure]
-                            st.metric(
-                                f"{measure.capitalize()} Change",
-                                f"{trend['change']} cm",
-                                f"{trend['change_percent']}%"
-                            )
-
-                # Show recent progress (simplified to just show time and duration)
-                st.write("### Recent Workouts")
-                if 'recent_progress' in summary and summary['recent_progress']:
-                    for entry in summary['recent_progress']:
-                        st.write(f"- {entry.get('timestamp', 'N/A')}: {entry.get('duration_min', 'N/A')} minutes")
-                else:
-                    st.write("No recent progress data available.")
-            else:
-                st.write("No progress data yet. Please log your first workout!")
+            _view_tab(profile_data)
 
         # Feedback section
-        st.subheader("Feedback")
-        feedback_text = st.text_area("Your Feedback")
-        if st.button("Submit Feedback"):
-            if feedback_text.strip():
-                result = orchestrator.run(profile_data, feedback_text=feedback_text)
-                st.success("✅ Feedback stored and plans updated!")
-
-                # Show updated plans
-                with st.expander("Updated Workout Plan"):
-                    st.text(result["workout_text"])
-
-                with st.expander("Updated Nutrition Plan"):
-                    if result["nutrition_json"] and "meal_plan" in result["nutrition_json"]:
-                        for meal in result["nutrition_json"]["meal_plan"]:
-                            st.write(f"**{meal.get('type', '')}**: {meal.get('description', '')}")
-                            st.write(f"  → {meal.get('calories', 'N/A')} kcal | "
-                                    f"Protein: {meal.get('protein', 'N/A')}g | "
-                                    f"Carbs: {meal.get('carbs', 'N/A')}g | "
-                                    f"Fat: {meal.get('fat', 'N/A')}g")
-                            st.write("")  # Add space between meals
-                    else:
-                        st.text(result["nutrition_text"])
-
-                if result["feedback_result"]:
-                    st.info(f"Feedback Agent Response: {result['feedback_result'].get('suggested_action', 'Feedback recorded')}")
-                if result.get("conflict_resolution"):
-                    st.info(f"Conflict Resolution: {result['conflict_resolution']}")
-                if result.get("dynamic_rules"):
-                    st.info(f"Dynamic Rules Applied: {result['dynamic_rules']}")
-            else:
-                st.warning("Please enter feedback.")
+        _feedback_section(profile_data)
     else:
         st.warning("Selected user profile not found. Please select another user.")
         st.session_state.selected_user = "New User"